@@ -0,0 +1,114 @@
+# Compares the per post cost of clean_post() with the old BeautifulSoup pass
+# Usage: python bench/clean_posts.py [--posts N] [--thread thread.json]
+# A thread.json saved from a.4cdn.org can be used instead of generated posts
+# The BeautifulSoup side needs beautifulsoup4 installed
+
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from gluebot.chan import clean_post
+from gluebot.utils import clean_lines
+
+try:
+    from bs4 import BeautifulSoup
+except ImportError:
+    BeautifulSoup = None
+
+
+pieces = [
+    '<a href="#p{n}" class="quotelink">&gt;&gt;{n}</a><br>',
+    '<span class="quote">&gt;be me</span><br>',
+    "literally just {n} words here<br>",
+    "it&#039;s &quot;fine&quot; &amp; good<br>",
+    '<span class="deadlink">&gt;&gt;{n}</span><br>',
+    "https://example.com/<wbr>some/<wbr>path<br>",
+    '<pre class="prettyprint">def f(x):<br>    return x</pre>',
+    "<s>spoiler</s> text<br><br>",
+]
+
+
+def make_posts(count):
+    posts = []
+
+    for _ in range(count):
+        size = random.randint(1, 10)
+        post = "".join(random.choice(pieces) for _ in range(size))
+        posts.append(post.format(n=random.randint(1000, 99999999)))
+
+    return posts
+
+
+def load_posts(path):
+    with open(path, "r") as file:
+        data = json.load(file)
+
+    return [post["com"] for post in data["posts"] if post.get("com")]
+
+
+def clean_soup(html):
+    soup = BeautifulSoup(html, "html.parser")
+
+    for elem in soup.select(".quotelink"):
+        elem.decompose()
+
+    for br in soup.find_all("br"):
+        br.replace_with("\n")
+
+    text = soup.get_text(separator="\n").strip()
+    return clean_lines(text)
+
+
+def measure(func, posts, rounds):
+    best = None
+
+    for _ in range(rounds):
+        start = time.perf_counter()
+
+        for post in posts:
+            func(post)
+
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best / len(posts) * 1_000_000
+
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--posts", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--thread", type=str, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+
+    if args.thread:
+        posts = load_posts(args.thread)
+    else:
+        posts = make_posts(args.posts)
+
+    print(f"Posts: {len(posts)}")
+    new = measure(clean_post, posts, args.rounds)
+    print(f"clean_post: {new:.1f} us/post")
+
+    if not BeautifulSoup:
+        print("beautifulsoup4 is not installed, skipping the comparison")
+        return
+
+    old = measure(clean_soup, posts, args.rounds)
+    print(f"BeautifulSoup: {old:.1f} us/post")
+    print(f"Speedup: {old / new:.1f}x")
+
+    different = sum(1 for post in posts if clean_post(post) != clean_soup(post))
+    print(f"Different outputs: {different}")
+
+
+if __name__ == "__main__":
+    run()
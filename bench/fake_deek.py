@@ -0,0 +1,128 @@
+# Local stand-in for deek.chat and the 4chan API used by bench/load.py
+# Serves /login/submit, /message/send/{room}, /ws and the two 4chan routes
+# Every upload is searched for bench-N markers so it can be matched to a command
+
+import asyncio
+import json
+import re
+import time
+
+from aiohttp import web
+
+marker = re.compile(rb"bench-(\d+)")
+
+
+class FakeDeek:
+    def __init__(self, upload_latency=0):
+        self.upload_latency = upload_latency
+        self.sockets = set()
+        self.connected = asyncio.Event()
+        self.logins = 0
+        # Tokens handed out by login, uploads without one of them get a 401
+        self.tokens = set()
+        self.rejected = 0
+        # (time, room, size, marker ids)
+        self.uploads = []
+        # (time, room, text) for messages the bot sent over the websocket
+        self.messages = []
+        self.runner = None
+
+    async def start(self, host="127.0.0.1", port=0):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/login/submit", self.login)
+        app.router.add_post("/message/send/{room}", self.upload)
+        app.router.add_get("/ws", self.socket)
+        app.router.add_get("/storage/files/{name}", self.file)
+        app.router.add_get("/{board}/threads.json", self.threads)
+        app.router.add_get("/{board}/thread/{id}.json", self.thread)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        # aiohttp doesn't send cookies to bare IP addresses
+        name = "localhost" if host == "127.0.0.1" else host
+        return f"http://{name}:{port}", f"ws://{name}:{port}/ws"
+
+    async def stop(self):
+        for ws in list(self.sockets):
+            await ws.close()
+
+        if self.runner:
+            await self.runner.cleanup()
+
+    async def login(self, request):
+        self.logins += 1
+        token = f"bench{self.logins}"
+        self.tokens.add(token)
+        response = web.Response(status=302)
+        response.headers.add("Set-Cookie", f"api_token={token}; Path=/")
+        response.headers.add("Set-Cookie", "session_id=bench; Path=/")
+        return response
+
+    def expire(self):
+        # Every session ends, like the real server restarting
+        self.tokens.clear()
+
+    async def upload(self, request):
+        if request.cookies.get("api_token") not in self.tokens:
+            self.rejected += 1
+            await request.read()
+            return web.Response(status=401)
+
+        room = request.match_info["room"]
+        size = 0
+        ids = []
+
+        async for part in (await request.multipart()):
+            data = await part.read()
+            size += len(data)
+            ids.extend(int(id) for id in marker.findall(data))
+
+        if self.upload_latency:
+            await asyncio.sleep(self.upload_latency)
+
+        self.uploads.append((time.monotonic(), room, size, ids))
+        return web.json_response({"status": "ok"})
+
+    async def socket(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.sockets.add(ws)
+        self.connected.set()
+
+        try:
+            async for message in ws:
+                data = json.loads(message.data)
+                now = time.monotonic()
+                self.messages.append((now, data.get("roomId"), data.get("data")))
+        finally:
+            self.sockets.discard(ws)
+
+            if not self.sockets:
+                self.connected.clear()
+
+        return ws
+
+    async def send(self, frame):
+        text = json.dumps(frame)
+
+        for ws in list(self.sockets):
+            await ws.send_str(text)
+
+    async def file(self, request):
+        # Source media for ,write and ,video
+        body = b"GIF89a" + b"\0" * (64 * 1024)
+        return web.Response(body=body, content_type="image/gif")
+
+    async def threads(self, request):
+        return web.json_response([{"page": 1, "threads": [{"no": 1}, {"no": 2}]}])
+
+    async def thread(self, request):
+        id = request.match_info["id"]
+        posts = [
+            {"no": int(id), "com": "bench post<br>with <b>two</b> lines"},
+            {"no": int(id) + 1, "com": '<span class="quote">&gt;bench</span>'},
+        ]
+
+        return web.json_response({"posts": posts})
@@ -0,0 +1,408 @@
+# Load test for the whole bot against a local fake deek.chat and a stub gifmaker
+# Usage: python bench/load.py [--count N] [--rate R] [--latency S] [--worker] [--pipe]
+#        python bench/load.py --replay frames.jsonl [--speed X]
+#        python bench/load.py --workers N [--kill S] for a gateway and N workers
+#        --expire S ends every session S seconds in to check that uploads log in again
+# Replays are JSON lines like {"time": 1.5, "frame": {"type": "message", ...}}
+# Command arguments are replaced with bench-N markers so uploads can be matched
+# Commands whose argument doesn't reach the file, like ,numbers, match by room order
+# Rate limits are off unless --limits is passed, so the pipeline itself is measured
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import resource
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import deque
+from pathlib import Path
+
+HERE = Path(__file__).parent
+sys.path.insert(0, str(HERE.parent))
+
+from fake_deek import FakeDeek
+
+from gluebot import config
+from gluebot.__main__ import run as run_bot
+from gluebot.bot import Bot
+from gluebot.commands import commands
+from gluebot.jobs import Gateway, JobWorker
+from gluebot.limits import RateLimiter
+
+
+# Commands that render from the last file posted in the room
+media_commands = ["write", "video"]
+# Commands that turn their argument into something else, like a number
+unmarked_commands = ["numbers"]
+
+
+def synthetic(count, rate, names, rooms, users):
+    frames = []
+    offset = 0
+
+    for n in range(count):
+        offset += random.expovariate(rate)
+        room = random.randint(1, rooms)
+        user = f"user{random.randint(1, users)}"
+        name = random.choice(names)
+        cmd = commands.get(name)
+
+        # ,write and ,video need a file posted in the room first
+        if cmd and (cmd.name in media_commands):
+            files = [{"name": f"bench{n}.gif", "extension": ".gif"}]
+            data = {"name": user, "files": files}
+            frames.append((offset, {"type": "files", "roomId": room, "data": data}))
+
+        data = {"name": user, "text": f"{config.prefix}{name} x"}
+        frames.append((offset, {"type": "message", "roomId": room, "data": data}))
+
+    return frames
+
+
+def load_replay(path):
+    frames = []
+
+    with open(path, "r") as file:
+        for line in file:
+            if line.strip():
+                item = json.loads(line)
+                frames.append((item["time"], item["frame"]))
+
+    start = frames[0][0] if frames else 0
+    return [(offset - start, frame) for offset, frame in frames]
+
+
+def tag(frame, id):
+    # Returns how the command's upload is found, None for commands that don't upload
+    # "marker" puts a marker in the argument, "order" takes the next unmarked
+    # upload in the same room, for commands whose argument doesn't reach the file
+    if frame.get("type") not in ["message", "messageEnd"]:
+        return None
+
+    data = frame.get("data") or {}
+    text = (data.get("text") or "").strip()
+
+    if not text.startswith(config.prefix):
+        return None
+
+    words = text.lstrip(config.prefix).split(" ")
+    cmd = commands.get(words[0])
+
+    if (not cmd) or (cmd.cooldown not in ["render", "heavy"]):
+        return None
+
+    if (cmd.args == "none") or (cmd.name in unmarked_commands):
+        return "order"
+
+    # Media picks like ^2 are kept
+    keep = [word for word in words[1:2] if re.fullmatch(r"\^\d+", word)]
+    data["text"] = " ".join([f"{config.prefix}{words[0]}", *keep, f"bench-{id}"])
+    return "marker"
+
+
+def percentile(values, q):
+    if not values:
+        return 0
+
+    values = sorted(values)
+    return values[max(0, math.ceil(q * len(values)) - 1)]
+
+
+def rss_mb():
+    with open("/proc/self/statm", "r") as file:
+        pages = int(file.read().split()[1])
+
+    return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+
+def setup(args, root):
+    config.chan_boards = ["g"]
+    config.chan_interval = 0
+    config.gifmaker_path = str(Path(HERE, "stub_gifmaker.py"))
+    config.scratch_dir = Path(root, "scratch")
+    config.media_dir = Path(root, "media")
+    config.render_dir = Path(root, "renders")
+    config.render_pipe = args.pipe
+    config.max_tasks = args.tasks
+    config.render_workers = args.renders
+    config.spool_lease = args.lease
+
+    if args.worker:
+        config.gifmaker_worker = True
+        config.gifmaker_python = sys.executable
+        config.worker_template_dir = str(Path(root, "templates"))
+
+    os.environ["GLUEBOT_STUB_LATENCY"] = str(args.latency)
+    os.environ["GLUEBOT_STUB_JITTER"] = str(args.jitter)
+    os.environ["GLUEBOT_STUB_SIZE"] = str(args.size)
+
+
+def spawn_workers(count, base, spool):
+    # Same arguments as this run, each worker with its own caches
+    argv = [sys.executable, __file__, *sys.argv[1:], "--serve", base, str(spool)]
+    return [subprocess.Popen(argv) for _ in range(count)]
+
+
+async def serve_worker(args, base, spool):
+    # The caches are shared like they would be on one host
+    setup(args, Path(spool).parent)
+    config.chan_url = base
+    await run_bot(JobWorker("gluebot", "bench", spool, url=base))
+
+
+async def expire_sessions(server, delay):
+    # The bot has to notice the 401s and log in again
+    await asyncio.sleep(delay)
+    server.expire()
+
+
+async def kill_worker(workers, delay):
+    # A worker dying mid run, its jobs come back after spool_lease
+    await asyncio.sleep(delay)
+    workers[0].send_signal(signal.SIGKILL)
+
+
+async def drive(server, frames, speed, sent, ordered):
+    start = time.monotonic()
+
+    for id, (offset, frame) in enumerate(frames):
+        wait = start + offset / speed - time.monotonic()
+
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+        mode = tag(frame, id)
+
+        if mode:
+            sent[id] = time.monotonic()
+
+        if mode == "order":
+            ordered.setdefault(str(frame.get("roomId")), deque()).append(id)
+
+        await server.send(frame)
+
+
+def stage_means(metrics):
+    stages = {}
+
+    for (name, labels), hist in metrics.histograms.items():
+        if name != "gluebot_stage_seconds":
+            continue
+
+        stage = dict(labels)["stage"]
+        count, total = stages.get(stage, (0, 0))
+        stages[stage] = (count + sum(hist[:-1]), total + hist[-1])
+
+    return {
+        stage: {"count": count, "mean_ms": total / count * 1000}
+        for stage, (count, total) in sorted(stages.items())
+        if count
+    }
+
+
+async def bench(args):
+    server = FakeDeek(args.upload_latency)
+    base, ws_base = await server.start()
+    temp = tempfile.TemporaryDirectory()
+    setup(args, temp.name)
+    config.chan_url = base
+    rss_start = rss_mb()
+
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    workers = []
+
+    if args.workers:
+        spool = Path(temp.name, "spool")
+        bot = Gateway("gluebot", "bench", spool, url=base, ws_url=ws_base)
+        workers = spawn_workers(args.workers, base, spool)
+    else:
+        bot = Bot("gluebot", "bench", url=base, ws_url=ws_base)
+
+    if not args.limits:
+        bot.limits.user = RateLimiter(10**9, 10**9, 1)
+        bot.limits.room = RateLimiter(10**9, 10**9, 1)
+        bot.limits.classes = {}
+
+    await bot.start()
+    await asyncio.wait_for(server.connected.wait(), 30)
+
+    if args.replay:
+        frames = load_replay(args.replay)
+    else:
+        frames = synthetic(args.count, args.rate, args.commands, args.rooms, args.users)
+
+    users = [f"user{n}" for n in range(1, args.users + 1)]
+    members = [{"name": name} for name in users]
+    rooms = {str(room): members for room in range(1, args.rooms + 1)}
+    await server.send({"type": "loadUsers", "data": rooms})
+
+    if workers and (args.kill is not None):
+        asyncio.create_task(kill_worker(workers, args.kill))
+
+    if args.expire is not None:
+        asyncio.create_task(expire_sessions(server, args.expire))
+
+    sent = {}
+    ordered = {}
+    started = time.monotonic()
+    await drive(server, frames, args.speed, sent, ordered)
+    deadline = time.monotonic() + args.drain
+    latencies = {}
+    seen = 0
+
+    while True:
+        for date, room, _, ids in server.uploads[seen:]:
+            for id in ids:
+                if (id in sent) and (id not in latencies):
+                    latencies[id] = date - sent[id]
+
+            waiting = ordered.get(room)
+
+            if (not ids) and waiting:
+                id = waiting.popleft()
+                latencies[id] = date - sent[id]
+
+        seen = len(server.uploads)
+
+        if (len(latencies) >= len(sent)) or (time.monotonic() > deadline):
+            break
+
+        await asyncio.sleep(0.1)
+
+    elapsed = time.monotonic() - started
+    heap_peak = None
+
+    if args.tracemalloc:
+        heap_peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        tracemalloc.stop()
+
+    rss_end = rss_mb()
+
+    for worker in workers:
+        worker.terminate()
+
+    for worker in workers:
+        await asyncio.to_thread(worker.wait)
+
+    await bot.stop()
+    await server.stop()
+    temp.cleanup()
+
+    values = [value * 1000 for value in latencies.values()]
+
+    drops = {
+        dict(labels)["reason"]: value
+        for (name, labels), value in bot.metrics.counters.items()
+        if name == "gluebot_dropped_total"
+    }
+
+    return {
+        "frames": len(frames),
+        "commands": len(sent),
+        "uploads": len(server.uploads),
+        "messages": len(server.messages),
+        "logins": server.logins,
+        "rejected": server.rejected,
+        "matched": len(latencies),
+        "dropped": len(sent) - len(latencies),
+        "drop_reasons": drops,
+        "seconds": elapsed,
+        "throughput": len(latencies) / max(elapsed, 0.001),
+        "latency_ms": {
+            "p50": percentile(values, 0.5),
+            "p90": percentile(values, 0.9),
+            "p99": percentile(values, 0.99),
+            "max": max(values, default=0),
+        },
+        "stages": stage_means(bot.metrics),
+        "memory_mb": {
+            "rss_start": rss_start,
+            "rss_end": rss_end,
+            "rss_peak": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "heap_peak": heap_peak,
+        },
+    }
+
+
+def show(report):
+    print(f"Frames: {report['frames']} | Commands: {report['commands']}")
+    print(f"Uploads: {report['uploads']} | Messages: {report['messages']}")
+    print(f"Logins: {report['logins']} | Rejected uploads: {report['rejected']}")
+    print(f"Matched: {report['matched']} | Dropped: {report['dropped']}")
+
+    if report["drop_reasons"]:
+        reasons = ", ".join(f"{k}: {v}" for k, v in report["drop_reasons"].items())
+        print(f"Drop reasons: {reasons}")
+
+    print(f"Time: {report['seconds']:.2f}s | Throughput: {report['throughput']:.2f}/s")
+    lat = report["latency_ms"]
+    quantiles = " | ".join(f"{key} {value:.0f} ms" for key, value in lat.items())
+    print(f"Command to upload: {quantiles}")
+
+    for stage, item in report["stages"].items():
+        print(f"  {stage}: {item['count']} x {item['mean_ms']:.2f} ms")
+
+    mem = report["memory_mb"]
+    line = f"RSS: {mem['rss_start']:.0f} -> {mem['rss_end']:.0f} MB"
+    line += f" | Peak: {mem['rss_peak']:.0f} MB"
+
+    if mem["heap_peak"] is not None:
+        line += f" | Python heap peak: {mem['heap_peak']:.1f} MB"
+
+    print(line)
+
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=20, help="Commands per second")
+    parser.add_argument("--commands", type=str, nargs="+", default=["describe"])
+    parser.add_argument("--rooms", type=int, default=3)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--replay", type=str, default=None)
+    parser.add_argument("--speed", type=float, default=1, help="Replay speed factor")
+    parser.add_argument("--latency", type=float, default=0.5, help="Render seconds")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--size", type=int, default=200 * 1024, help="Stub file bytes")
+    parser.add_argument("--upload-latency", type=float, default=0)
+    parser.add_argument("--tasks", type=int, default=config.max_tasks)
+    parser.add_argument("--renders", type=int, default=config.render_workers)
+    parser.add_argument("--drain", type=float, default=60)
+    parser.add_argument("--worker", action="store_true")
+    parser.add_argument("--pipe", action="store_true")
+    parser.add_argument("--limits", action="store_true")
+    parser.add_argument("--tracemalloc", action="store_true")
+    parser.add_argument("--json", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=0, help="Worker processes")
+    parser.add_argument("--kill", type=float, default=None, help="Kill one at S")
+    parser.add_argument("--lease", type=float, default=config.spool_lease)
+    parser.add_argument("--expire", type=float, default=None, help="End sessions at S")
+    parser.add_argument("--serve", nargs=2, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        asyncio.run(serve_worker(args, *args.serve))
+        return
+
+    random.seed(args.seed)
+    report = asyncio.run(bench(args))
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        show(report)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# Stands in for gifmaker in bench/load.py
+# Takes the same options, waits a while and writes a fake file
+# that holds the words so uploads can be matched to commands
+# GLUEBOT_STUB_LATENCY, GLUEBOT_STUB_JITTER and GLUEBOT_STUB_SIZE change its behavior
+
+import argparse
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", type=str, default=".")
+    parser.add_argument("--format", type=str, default="gif")
+    parser.add_argument("--words", type=str, default="")
+    args, _ = parser.parse_known_args()
+
+    latency = float(os.environ.get("GLUEBOT_STUB_LATENCY", "0.5"))
+    jitter = float(os.environ.get("GLUEBOT_STUB_JITTER", "0"))
+    size = int(os.environ.get("GLUEBOT_STUB_SIZE", str(200 * 1024)))
+
+    time.sleep(max(0, latency + random.uniform(-jitter, jitter)))
+
+    output = Path(args.output)
+
+    if output.is_dir():
+        output = Path(output, f"render.{args.format}")
+
+    head = b"GIF89a" + args.words.encode() + b"\n"
+    body = head + b"\0" * max(0, size - len(head))
+
+    with open(output, "wb") as file:
+        file.write(body)
+
+    print(output)
+
+
+if __name__ == "__main__":
+    sys.exit(run())
@@ -0,0 +1,11 @@
+# Importing the package alone loads nothing else, so modules like
+# gluebot.chan can be used on their own without the network stack
+
+
+def __getattr__(name):
+    if name == "Bot":
+        from .bot import Bot
+
+        return Bot
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,61 @@
+import argparse
+import asyncio
+import signal
+import sys
+
+from . import config
+from .bot import Bot
+from .render import sweep_scratch
+from .utils import msg
+
+
+async def run(bot):
+    # SIGINT and SIGTERM let the queued commands finish before stopping
+    loop = asyncio.get_running_loop()
+    stopping = asyncio.Event()
+
+    for sig in [signal.SIGINT, signal.SIGTERM]:
+        loop.add_signal_handler(sig, stopping.set)
+
+    await bot.start()
+    stop = asyncio.create_task(stopping.wait())
+    await asyncio.wait([stop, bot.task], return_when=asyncio.FIRST_COMPLETED)
+    stop.cancel()
+    msg("Stopping...")
+    await bot.drain(config.drain_timeout)
+    await bot.stop()
+
+
+def make_bot(mode, spool):
+    # The split modes are only imported when asked for
+    if mode == "standalone":
+        return Bot(config.username, config.password)
+
+    from .jobs import Gateway, JobWorker
+
+    if mode == "gateway":
+        return Gateway(config.username, config.password, spool)
+
+    return JobWorker(config.username, config.password, spool)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="gluebot")
+    parser.add_argument(
+        "--mode", choices=["standalone", "gateway", "worker"], default="standalone"
+    )
+    parser.add_argument("--spool", type=str, default=str(config.spool_dir))
+    args = parser.parse_args()
+
+    if not config.username or not config.password:
+        msg("Missing environment variables")
+        sys.exit(1)
+
+    if args.mode != "gateway":
+        sweep_scratch()
+
+    asyncio.run(run(make_bot(args.mode, args.spool)))
+
+
+if __name__ == "__main__":
+    main()
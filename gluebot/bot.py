@@ -0,0 +1,430 @@
+import asyncio
+import json
+import random
+import re
+import time
+import traceback
+from urllib.parse import urlparse
+
+import aiohttp
+import websockets
+from yarl import URL
+
+from . import config
+from .cache import MediaCache, RenderCache
+from .chan import ChanFeed
+from .commands import command_arg, commands, invoke
+from .events import (
+    EnterEvent,
+    ExitEvent,
+    FilesEvent,
+    MessageEvent,
+    UsersEvent,
+    decode_frame,
+)
+from .gifmaker import RenderWorker, worker_argv
+from .limits import Limits
+from .media import RecentMedia
+from .metrics import Metrics, dump_metrics, start_metrics
+from .presence import Presence
+from .queues import Dispatcher, RenderPool
+from .utils import msg
+
+decode_stage = (("stage", "decode"), ("command", "none"))
+handle_stage = (("stage", "dispatch"), ("command", "none"))
+
+
+class Bot:
+    # One chat account and everything it keeps, several can share a process
+    # start() connects in the background and keeps reconnecting
+    # drain() stops taking commands and waits for the queued ones
+    # stop() closes the connection and everything start() made
+    def __init__(self, username, password, url=None, ws_url=None):
+        self.username = username
+        self.password = password
+        self.url = url or config.url
+        self.ws_url = ws_url or config.ws_url
+        self.headers = config.headers.copy()
+        self.token = None
+        self.session = None
+        self.ws = None
+        self.http_sessions = {}
+        self.presence = Presence()
+        self.recent_media = RecentMedia(
+            config.recent_media_size, config.recent_media_rooms
+        )
+        self.limits = Limits()
+        self.metrics = Metrics(config.metrics_buckets)
+        self.dispatcher = None
+        self.render_pool = None
+        self.media_cache = None
+        self.render_cache = None
+        self.chan_feed = None
+        self.render_worker = None
+        self.metrics_runner = None
+        self.metrics_task = None
+        self.task = None
+        self.accepting = True
+        self.connected = asyncio.Event()
+        self.auth_lock = asyncio.Lock()
+
+    async def start(self):
+        await self.setup()
+
+        if config.metrics_port is not None:
+            try:
+                self.metrics_runner = await start_metrics(
+                    self.metrics,
+                    self.collect_gauges,
+                    config.metrics_host,
+                    config.metrics_port,
+                )
+            except Exception as e:
+                msg(f"(Metrics) Error: {e}")
+
+        if config.metrics_dump:
+            self.metrics_task = asyncio.create_task(
+                dump_metrics(
+                    self.metrics,
+                    self.collect_gauges,
+                    config.metrics_dump,
+                    config.metrics_interval,
+                )
+            )
+
+        self.accepting = True
+        self.task = asyncio.create_task(self.serve())
+
+    async def setup(self):
+        # The parts that run commands, they live across reconnects
+        self.dispatcher = Dispatcher(
+            config.max_tasks, config.room_queue_size, self.metrics, config.room_lanes
+        )
+
+        self.setup_chan()
+        await self.setup_render()
+
+    def setup_chan(self):
+        self.chan_feed = ChanFeed(
+            config.chan_url,
+            config.chan_boards,
+            config.chan_catalog_ttl,
+            config.chan_pool_size,
+            config.chan_post_ttl,
+            config.chan_interval,
+            self.http_session,
+        )
+
+    async def setup_render(self):
+        self.render_cache = RenderCache(
+            config.render_dir, config.render_cache_ttl, config.render_cache_bytes
+        )
+
+        self.media_cache = MediaCache(
+            config.media_dir,
+            config.media_max_bytes,
+            config.media_chunk_size,
+            self.http_session,
+        )
+
+        self.render_pool = RenderPool(
+            config.render_workers,
+            config.render_queue_size,
+            config.render_max_wait,
+            self.metrics,
+        )
+
+        if config.gifmaker_worker:
+            self.render_worker = RenderWorker(
+                worker_argv(), config.worker_timeout, config.worker_restart_delay
+            )
+
+            await self.render_worker.start()
+
+    async def drain(self, timeout=None):
+        # New commands are ignored from here on, the socket stays open
+        # so the queued ones can still reply
+        self.accepting = False
+
+        if not self.dispatcher:
+            return
+
+        try:
+            await asyncio.wait_for(self.dispatcher.join(), timeout)
+        except asyncio.TimeoutError:
+            msg("(Bot) Drain timed out, dropping the rest")
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+        if self.dispatcher:
+            await self.dispatcher.close()
+
+        if self.render_pool:
+            await self.render_pool.close()
+
+        if self.media_cache:
+            await self.media_cache.close()
+
+        if self.chan_feed:
+            await self.chan_feed.close()
+
+        await self.close_sessions()
+
+        if self.render_worker:
+            await self.render_worker.close()
+
+        if self.metrics_runner:
+            await self.metrics_runner.cleanup()
+
+        if self.metrics_task:
+            self.metrics_task.cancel()
+            await asyncio.gather(self.metrics_task, return_exceptions=True)
+
+    async def wait(self):
+        if self.task:
+            await asyncio.gather(self.task, return_exceptions=True)
+
+    async def auth(self):
+        data = {"name": self.username, "password": self.password, "submit": "log+in"}
+        headers = {key: value for key, value in self.headers.items() if key != "Cookie"}
+        link = self.url + "/login/submit"
+
+        async with self.http_session(link).post(
+            link, headers=headers, data=data, allow_redirects=False
+        ) as res:
+            cookie = ", ".join(res.headers.getall("Set-Cookie", []))
+
+        self.token = re.search("(?:api_token)=[^;]+", cookie).group(0)
+        self.session = re.search("(?:session_id)=[^;]+", cookie).group(0)
+        self.headers["Cookie"] = self.token + "; " + self.session
+        jar = self.http_session(self.url).cookie_jar
+        jar.update_cookies(self.auth_cookies(), URL(self.url))
+
+    async def login(self):
+        # Retries with backoff until the server takes the credentials
+        backoff = config.reconnect_min
+
+        while not self.token:
+            try:
+                await self.auth()
+                msg("Authenticated")
+            except Exception as e:
+                msg(f"(Auth) Error: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, config.reconnect_max)
+
+    async def reauth(self, rejected):
+        # The cookie is reused until the server rejects it, then one login
+        # serves every request that saw the same rejected token
+        async with self.auth_lock:
+            if self.token == rejected:
+                self.token = None
+
+            await self.login()
+
+    def auth_cookies(self):
+        return {
+            "session_id": self.session.split("=")[1],
+            "api_token": self.token.split("=")[1],
+        }
+
+    def http_session(self, link):
+        # One pooled keep-alive session per host, closed by stop()
+        host = urlparse(link).netloc
+        sess = self.http_sessions.get(host)
+
+        if (sess is None) or sess.closed:
+            cookies = None
+
+            if self.token and (host == urlparse(self.url).netloc):
+                cookies = self.auth_cookies()
+
+            connector = aiohttp.TCPConnector(
+                limit_per_host=config.http_limit,
+                keepalive_timeout=config.http_keepalive,
+            )
+
+            timeout = aiohttp.ClientTimeout(
+                total=None,
+                connect=config.http_connect_timeout,
+                sock_read=config.http_read_timeout,
+            )
+
+            sess = aiohttp.ClientSession(
+                connector=connector, timeout=timeout, cookies=cookies
+            )
+
+            self.http_sessions[host] = sess
+
+        return sess
+
+    async def close_sessions(self):
+        for sess in self.http_sessions.values():
+            await sess.close()
+
+        self.http_sessions.clear()
+
+    def collect_gauges(self):
+        if self.render_pool:
+            self.render_pool.gauges()
+
+        if self.dispatcher:
+            self.metrics.set("gluebot_room_queued", (), self.dispatcher.queued())
+
+        if self.media_cache:
+            self.metrics.set("gluebot_media_cache_bytes", (), self.media_cache.total)
+
+        if self.render_cache:
+            self.metrics.set("gluebot_render_cache_bytes", (), self.render_cache.total)
+
+    def update_userlist(self, event):
+        if isinstance(event, UsersEvent):
+            self.presence.load(event.rooms)
+        elif isinstance(event, EnterEvent):
+            if event.room_id is not None:
+                self.presence.add(event.room_id, event.name)
+        elif isinstance(event, ExitEvent):
+            self.presence.remove(event.room_id, event.name)
+
+    async def run(self):
+        # One websocket connection, queued commands outlive it
+        async with websockets.connect(self.ws_url, extra_headers=self.headers) as ws:
+            self.ws = ws
+            self.connected.set()
+
+            try:
+                while True:
+                    frame = await ws.recv()
+                    started = time.perf_counter()
+                    event = decode_frame(frame)
+                    decoded = time.perf_counter()
+                    elapsed = decoded - started
+                    self.metrics.observe("gluebot_stage_seconds", decode_stage, elapsed)
+
+                    if event is None:
+                        continue
+
+                    self.update_userlist(event)
+                    await self.on_message(event)
+                    elapsed = time.perf_counter() - decoded
+                    self.metrics.observe("gluebot_stage_seconds", handle_stage, elapsed)
+            except websockets.exceptions.ConnectionClosedOK:
+                msg("WebSocket connection closed")
+            except Exception as e:
+                msg(f"(WebSocket) Error: {e}")
+                traceback.print_exc()
+            finally:
+                self.connected.clear()
+
+    async def serve(self):
+        # Reconnects until stop(), everything but the socket lives across reconnects
+        backoff = config.reconnect_min
+
+        while True:
+            started = time.monotonic()
+
+            try:
+                # The cookie is reused until the server rejects it
+                if not self.token:
+                    async with self.auth_lock:
+                        await self.login()
+
+                await self.run()
+                msg("Disconnected")
+            except websockets.exceptions.InvalidStatusCode as e:
+                msg(f"(Main) Connection rejected: {e.status_code}")
+
+                if e.status_code in [401, 403]:
+                    self.token = None
+            except Exception as e:
+                msg(f"(Main) Error: {e}")
+                traceback.print_exc()
+
+            if (time.monotonic() - started) > config.reconnect_reset:
+                backoff = config.reconnect_min
+
+            wait = backoff / 2 + random.uniform(0, backoff / 2)
+            msg(f"Reconnecting in {wait:.1f} seconds...")
+            await asyncio.sleep(wait)
+            backoff = min(backoff * 2, config.reconnect_max)
+
+    async def on_message(self, event):
+        if isinstance(event, FilesEvent):
+            if event.name == self.username:
+                return
+
+            for file in event.files:
+                name = file.get("name")
+                ext = file.get("extension")
+
+                if (not name) or (not ext):
+                    continue
+
+                if ext not in [".jpg", ".jpeg", ".png", ".gif", ".webm", ".mp4"]:
+                    continue
+
+                # Downloaded now so it's already on disk when a command wants it
+                link = f"{self.url}/storage/files/{name}"
+                self.recent_media.add(event.room_id, link, ext)
+
+                if self.media_cache:
+                    self.media_cache.prefetch(link, ext)
+        elif isinstance(event, MessageEvent):
+            if event.name == self.username:
+                return
+
+            text = event.text.strip()
+
+            if (not self.accepting) or (not text.startswith(config.prefix)):
+                return
+
+            room_id = event.room_id
+            words = text.lstrip(config.prefix).split(" ")
+            cmd = commands.get(words[0])
+
+            if not cmd:
+                return
+
+            arg = command_arg(cmd, words[1:])
+
+            if (cmd.args == "required") and (not arg):
+                return
+
+            ready = self.limits.reserve(event.name, room_id, cmd.cooldown)
+
+            if ready is None:
+                self.metrics.count("gluebot_dropped_total", (("reason", "rate"),))
+                msg(f"(Rate) Dropping {cmd.name} from {event.name} in room {room_id}")
+                return
+
+            labels = (("command", cmd.name), ("room", room_id))
+            self.metrics.count("gluebot_commands_total", labels)
+            self.submit(cmd, event.name, arg, room_id, ready)
+
+    def submit(self, cmd, user, arg, room_id, ready):
+        # ready is a time.monotonic() value
+        self.dispatch(room_id, invoke(self, cmd, arg, room_id), ready, cmd.lane)
+
+    def dispatch(self, room_id, coro, ready=0, lane=None):
+        self.dispatcher.submit(room_id, coro, ready, lane)
+
+    async def send_message(self, text, room_id):
+        # Replies wait a bit for a reconnect, past that only the text is lost
+        try:
+            await asyncio.wait_for(self.connected.wait(), config.send_wait)
+            await self.send_frame(text, room_id)
+            return True
+        except (asyncio.TimeoutError, websockets.exceptions.ConnectionClosed):
+            self.metrics.count("gluebot_dropped_total", (("reason", "send"),))
+            msg(f"(Send) Not connected, dropping reply in room {room_id}")
+            return False
+
+    async def send_frame(self, text, room_id):
+        data = json.dumps({"type": "message", "data": text, "roomId": room_id})
+
+        with self.metrics.stage("send"):
+            await self.ws.send(data)
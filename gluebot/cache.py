@@ -0,0 +1,283 @@
+import asyncio
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from pathlib import Path
+from urllib.parse import urlparse
+
+from .utils import get_time, msg, remove_file
+
+# A .part file this old in the media directory was left by a crash
+part_max_age = 60 * 60
+
+
+class MediaCache:
+    # Downloaded source media kept on disk by storage file name
+    # Several processes can share the directory, so the files themselves
+    # are the state: mtime is the last use and a shared flock pins a file
+    # The least recently used unpinned files go once max_bytes is exceeded
+    # session(link) gives the pooled HTTP session to download with
+    def __init__(self, root, max_bytes, chunk_size, session):
+        self.root = root
+        self.session = session
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.total = 0
+        self.pending = {}
+        self.root.mkdir(parents=True, exist_ok=True)
+        limit = get_time() - part_max_age
+
+        # Only parts left by a crash, other processes may be writing theirs
+        for path in self.root.glob("*.part"):
+            try:
+                if path.stat().st_mtime < limit:
+                    remove_file(path)
+            except FileNotFoundError:
+                pass
+
+        self.evict()
+
+    def file_name(self, link, ext):
+        name = Path(urlparse(link).path).name
+
+        if not name.lower().endswith(ext.lower()):
+            name += ext
+
+        return name
+
+    def prefetch(self, link, ext):
+        name = self.file_name(link, ext)
+
+        if (name not in self.pending) and (not Path(self.root, name).exists()):
+            self.start(link, name)
+
+    def start(self, link, name):
+        task = asyncio.create_task(self.download(link, name))
+        self.pending[name] = task
+        task.add_done_callback(lambda _: self.pending.pop(name, None))
+        return task
+
+    async def fetch(self, link, ext):
+        name = self.file_name(link, ext)
+
+        try:
+            # Marks the file as used, eviction goes by mtime
+            os.utime(Path(self.root, name))
+            return name
+        except FileNotFoundError:
+            pass
+
+        task = self.pending.get(name) or self.start(link, name)
+
+        # Shielded so a cancelled command doesn't abort a shared download
+        if await asyncio.shield(task):
+            return name
+
+        return None
+
+    async def download(self, link, name):
+        path = Path(self.root, name)
+        # Unique so processes fetching the same file don't write into each other
+        temp = Path(self.root, f"{name}.{os.getpid()}-{uuid.uuid4().hex[:8]}.part")
+
+        try:
+            async with self.session(link).get(link) as response:
+                response.raise_for_status()
+
+                with open(temp, "wb") as file:
+                    async for chunk in response.content.iter_chunked(self.chunk_size):
+                        file.write(chunk)
+
+            temp.replace(path)
+        except Exception as e:
+            msg(f"(Media) Error: {e}")
+            temp.unlink(missing_ok=True)
+            return False
+
+        self.evict()
+        return True
+
+    def evict(self):
+        files = []
+        self.total = 0
+
+        for entry in os.scandir(self.root):
+            if entry.name.endswith(".part"):
+                continue
+
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+
+            files.append((stat.st_mtime, entry.path, stat.st_size))
+            self.total += stat.st_size
+
+        files.sort()
+
+        for date, path, size in files:
+            if self.total <= self.max_bytes:
+                break
+
+            if self.remove(path):
+                self.total -= size
+
+    def remove(self, path):
+        # Files another command holds a shared lock on are skipped
+        try:
+            with open(path, "rb") as file:
+                try:
+                    fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return False
+
+                os.unlink(path)
+                return True
+        except FileNotFoundError:
+            return True
+
+    @asynccontextmanager
+    async def use(self, link, ext):
+        # Two tries since another process can evict between fetch and open
+        for _ in range(2):
+            name = await self.fetch(link, ext)
+
+            if not name:
+                yield None
+                return
+
+            path = Path(self.root, name)
+
+            try:
+                file = open(path, "rb")
+            except FileNotFoundError:
+                continue
+
+            fcntl.flock(file, fcntl.LOCK_SH)
+
+            # Evicted after open but before the lock
+            if os.fstat(file.fileno()).st_nlink == 0:
+                file.close()
+                continue
+
+            try:
+                yield path
+            finally:
+                file.close()
+                self.evict()
+
+            return
+
+        yield None
+
+    async def close(self):
+        tasks = list(self.pending.values())
+
+        for task in tasks:
+            task.cancel()
+
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class RenderCache:
+    # Finished renders of deterministic commands, looked up by render_key
+    # Entries expire after ttl and the oldest go first past max_bytes
+    def __init__(self, root, ttl, max_bytes):
+        self.root = root
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total = 0
+        self.root.mkdir(parents=True, exist_ok=True)
+
+        files = [path for path in self.root.iterdir() if path.is_file()]
+        files.sort(key=lambda path: path.stat().st_mtime)
+        limit = get_time() - part_max_age
+
+        for path in files:
+            stat = path.stat()
+
+            # Copies still being written start with a dot
+            if path.name.startswith("."):
+                if stat.st_mtime < limit:
+                    remove_file(path)
+
+                continue
+
+            self.entries[path.stem] = (path, stat.st_size, stat.st_mtime)
+            self.total += stat.st_size
+
+        self.evict()
+
+    def get(self, key):
+        entry = self.entries.get(key)
+
+        if not entry:
+            return None
+
+        path, size, date = entry
+
+        if ((get_time() - date) > self.ttl) or (not path.exists()):
+            self.remove(key)
+            return None
+
+        self.entries.move_to_end(key)
+        return path
+
+    def put(self, key, source):
+        path = Path(self.root, key + source.suffix)
+
+        if key in self.entries:
+            self.remove(key)
+
+        # Copied under a unique name first, other processes may be reading it
+        temp = Path(self.root, f".{key}.{os.getpid()}-{uuid.uuid4().hex[:8]}")
+
+        try:
+            shutil.copyfile(source, temp)
+            temp.replace(path)
+        except Exception as e:
+            msg(f"(Render Cache) Error: {e}")
+            temp.unlink(missing_ok=True)
+            return
+
+        size = path.stat().st_size
+        self.entries[key] = (path, size, get_time())
+        self.total += size
+        self.evict()
+
+    def remove(self, key):
+        path, size, date = self.entries.pop(key)
+        self.total -= size
+        path.unlink(missing_ok=True)
+
+    def evict(self):
+        now = get_time()
+
+        for key, (path, size, date) in list(self.entries.items()):
+            if (now - date) > self.ttl:
+                self.remove(key)
+
+        while self.entries and (self.total > self.max_bytes):
+            self.remove(next(iter(self.entries)))
+
+
+def render_key(command, seed):
+    # The input template's mtime is part of the key so edited assets re-render
+    template = command.get("input")
+    stamp = None
+
+    if template:
+        try:
+            stamp = Path(template).stat().st_mtime
+        except OSError:
+            pass
+
+    options = sorted((key, str(value)) for key, value in command.items())
+    text = json.dumps([template, stamp, options, seed])
+    return hashlib.sha1(text.encode()).hexdigest()
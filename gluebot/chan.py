@@ -0,0 +1,356 @@
+import asyncio
+import heapq
+import itertools
+import random
+import time
+from collections import deque
+from html.entities import html5 as html_entities
+from html.parser import HTMLParser
+
+from .utils import clean_lines, get_time, msg
+
+
+class PostCleaner(HTMLParser):
+    # Streaming replacement for the old BeautifulSoup pass over 4chan comments
+    # It mirrors how bs4 splits and joins text so the output stays the same:
+    # quotelink elements are dropped, <br> becomes its own newline string,
+    # every text segment between tags is joined with a newline
+    void_tags = {
+        "area",
+        "base",
+        "br",
+        "col",
+        "embed",
+        "hr",
+        "img",
+        "input",
+        "keygen",
+        "link",
+        "menuitem",
+        "meta",
+        "param",
+        "source",
+        "track",
+        "wbr",
+        "basefont",
+        "bgsound",
+        "command",
+        "frame",
+        "image",
+        "isindex",
+        "nextid",
+        "spacer",
+    }
+
+    preserve_tags = {"pre", "textarea"}
+    hidden_tags = {"rt", "rp", "style", "script", "template"}
+    spaces = " \n\t\x0c\r"
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+
+    def reset(self):
+        super().reset()
+        self.parts = []
+        self.data = []
+        self.stack = []
+        self.closed = []
+        self.skip = 0
+        self.preserve = 0
+        self.hidden = 0
+
+    def clean(self, html):
+        self.reset()
+        self.feed(html)
+        self.close()
+        self.flush()
+        return "\n".join(self.parts)
+
+    def flush(self, cdata=False):
+        if not self.data:
+            return
+
+        data = "".join(self.data)
+        self.data = []
+
+        if self.skip or (self.hidden and (not cdata)):
+            return
+
+        if (not self.preserve) and (not data.strip(self.spaces)):
+            data = "\n" if "\n" in data else " "
+
+        self.parts.append(data)
+
+    def handle_starttag(self, tag, attrs, void=True):
+        self.flush()
+        self.stack.append(tag)
+
+        if tag in self.preserve_tags:
+            self.preserve += 1
+
+        if tag in self.hidden_tags:
+            self.hidden += 1
+
+        # Both quotelinks and <br> get removed with everything inside them,
+        # a <br/> after a <br> stays open in bs4 and swallows what follows
+        if not self.skip:
+            if tag == "br":
+                self.skip = len(self.stack)
+
+            for key, value in attrs:
+                if (key == "class") and value and ("quotelink" in value.split()):
+                    self.skip = len(self.stack)
+                    break
+
+        if void and (tag in self.void_tags):
+            self.end_tag(tag)
+            self.closed.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs, void=False)
+        self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in self.closed:
+            self.closed.remove(tag)
+            return
+
+        self.end_tag(tag)
+
+    def end_tag(self, tag):
+        self.flush()
+
+        if tag not in self.stack:
+            return
+
+        while self.stack:
+            name = self.stack.pop()
+
+            if name in self.preserve_tags:
+                self.preserve -= 1
+
+            if name in self.hidden_tags:
+                self.hidden -= 1
+
+            if self.skip > len(self.stack):
+                self.skip = 0
+
+                if name == "br":
+                    self.parts.append("\n")
+
+            if name == tag:
+                break
+
+    def handle_data(self, data):
+        self.data.append(data)
+
+    def handle_charref(self, name):
+        if name[:1] in ["x", "X"]:
+            number = int(name[1:], 16)
+        else:
+            number = int(name)
+
+        data = None
+
+        if number < 256:
+            try:
+                data = bytes([number]).decode("windows-1252")
+            except UnicodeDecodeError:
+                pass
+
+        if not data:
+            try:
+                data = chr(number)
+            except (ValueError, OverflowError):
+                pass
+
+        self.handle_data(data or "\N{REPLACEMENT CHARACTER}")
+
+    def handle_entityref(self, name):
+        self.handle_data(html_entities.get(name + ";", f"&{name}"))
+
+    def handle_comment(self, data):
+        self.flush()
+
+    def handle_decl(self, data):
+        self.flush()
+
+    def unknown_decl(self, data):
+        self.flush()
+
+        if data.upper().startswith("CDATA["):
+            self.data.append(data[6:])
+            self.flush(cdata=True)
+
+    def handle_pi(self, data):
+        self.flush()
+
+
+post_cleaner = PostCleaner()
+
+
+def clean_post(html):
+    text = post_cleaner.clean(html).strip()
+    return clean_lines(text)
+
+
+class ChanFeed:
+    # Keeps each board's thread list for a while and a few ready posts per board
+    # Pools fill lazily, taking a post starts a background refill of that board
+    # Requests for a waiting command go ahead of the refills
+    # session(link) gives the pooled HTTP session to request with
+    def __init__(
+        self, base, boards, catalog_ttl, pool_size, post_ttl, interval, session
+    ):
+        self.base = base
+        self.session = session
+        self.boards = boards
+        self.catalog_ttl = catalog_ttl
+        self.pool_size = pool_size
+        self.post_ttl = post_ttl
+        self.interval = interval
+        self.catalogs = {}
+        self.pools = {board: deque() for board in boards}
+        self.refills = {}
+        self.waiters = []
+        self.counter = itertools.count()
+        self.gate = None
+        self.last_request = 0
+
+    async def throttle(self, urgent):
+        # Requests are spaced out by interval across all boards
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (0 if urgent else 1, next(self.counter), future))
+
+        if (self.gate is None) or self.gate.done():
+            self.gate = asyncio.create_task(self.open_gate())
+
+        await future
+
+    async def open_gate(self):
+        while self.waiters:
+            wait = self.last_request + self.interval - time.monotonic()
+
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+            # Picked after the wait so a command that came in meanwhile goes first
+            while self.waiters:
+                _, _, future = heapq.heappop(self.waiters)
+
+                if not future.done():
+                    self.last_request = time.monotonic()
+                    future.set_result(None)
+                    break
+
+    async def get(self, link, headers=None, urgent=False):
+        await self.throttle(urgent)
+
+        async with self.session(link).get(link, headers=headers) as response:
+            if response.status == 304:
+                return response.status, None, None
+
+            response.raise_for_status()
+            data = await response.json()
+            return response.status, data, response.headers.get("Last-Modified")
+
+    async def catalog(self, board, urgent=False):
+        entry = self.catalogs.get(board)
+
+        if entry and ((get_time() - entry[0]) < self.catalog_ttl):
+            return entry[2]
+
+        headers = {}
+
+        if entry and entry[1]:
+            headers["If-Modified-Since"] = entry[1]
+
+        link = f"{self.base}/{board}/threads.json"
+        status, data, modified = await self.get(link, headers, urgent)
+
+        if status == 304:
+            threads = entry[2]
+            modified = entry[1]
+        else:
+            threads = [thread["no"] for thread in data[0]["threads"]]
+
+        self.catalogs[board] = (get_time(), modified, threads)
+        return threads
+
+    async def fetch_post(self, board, urgent=False):
+        threads = await self.catalog(board, urgent)
+
+        # Select a random thread
+        id = random.choice(threads)
+        link = f"{self.base}/{board}/thread/{id}.json"
+
+        # Fetch the selected thread
+        status, data, modified = await self.get(link, urgent=urgent)
+        posts = data["posts"]
+
+        # Select a random post
+        post = random.choice(posts)
+        number = post.get("no", "")
+        html = post.get("com", "")
+
+        if not html:
+            return None
+
+        text = clean_post(html)
+        url = f">boards.4chan.org/{board}/thread/{id}#p{number}"
+
+        if not text:
+            return url
+
+        return f"{text}\n{url}"
+
+    async def take(self, board):
+        pool = self.pools[board]
+        text = None
+
+        while pool:
+            date, text = pool.popleft()
+
+            if (get_time() - date) < self.post_ttl:
+                break
+
+            text = None
+
+        if not text:
+            text = await self.fetch_post(board, urgent=True)
+
+        self.refill(board)
+        return text
+
+    def refill(self, board):
+        if board in self.refills:
+            return
+
+        task = asyncio.create_task(self.fill(board))
+        self.refills[board] = task
+        task.add_done_callback(lambda _: self.refills.pop(board, None))
+
+    async def fill(self, board):
+        pool = self.pools[board]
+        tries = self.pool_size * 3
+
+        try:
+            while (len(pool) < self.pool_size) and (tries > 0):
+                tries -= 1
+                text = await self.fetch_post(board)
+
+                if text:
+                    pool.append((get_time(), text))
+        except Exception as e:
+            msg(f"(Chan) Error filling /{board}/: {e}")
+
+    async def close(self):
+        tasks = list(self.refills.values())
+
+        if self.gate:
+            tasks.append(self.gate)
+
+        for task in tasks:
+            task.cancel()
+
+        await asyncio.gather(*tasks, return_exceptions=True)
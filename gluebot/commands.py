@@ -0,0 +1,447 @@
+import random
+import re
+from datetime import datetime
+
+from .data import dataset, random_country
+from .gifmaker import clean_gifmaker, gifmaker_command, oracle_command
+from .metrics import command_name
+from .render import (
+    cost_cheap,
+    cost_heavy,
+    cost_normal,
+    render_cost,
+    run_gifmaker,
+    run_oracle,
+)
+from .utils import (
+    clean_list,
+    extract_range,
+    get_path,
+    msg,
+    random_date,
+    random_int,
+    string_to_number,
+)
+
+commands = {}
+# In registration order, which is the order ,help lists them in
+command_list = []
+
+
+class Command:
+    __slots__ = (
+        "name",
+        "aliases",
+        "handler",
+        "args",
+        "cooldown",
+        "cost",
+        "hidden",
+        "gateway",
+        "lane",
+    )
+
+    def __init__(self, aliases, handler, args, cooldown, cost, hidden, gateway):
+        self.name = aliases[0]
+        self.aliases = aliases
+        self.handler = handler
+        self.args = args
+        self.cooldown = cooldown
+        self.cost = cost
+        self.hidden = hidden
+        self.gateway = gateway
+
+        # Text replies keep their order in a room, cheap renders get their own
+        # lane so they can pass the slow ones and the render priority applies
+        if cooldown == "chat":
+            self.lane = "chat"
+        elif cost == cost_cheap:
+            self.lane = "cheap"
+        else:
+            self.lane = "render"
+
+
+def command(
+    *aliases,
+    args="none",
+    cooldown="chat",
+    cost=cost_normal,
+    hidden=False,
+    gateway=False,
+):
+    # args is "none", "optional" or "required"
+    # Handlers are called as handler(bot, arg, room_id)
+    # gateway=True runs it in the gateway in split mode, for state kept in one place
+    def decorator(handler):
+        cmd = Command(aliases, handler, args, cooldown, cost, hidden, gateway)
+        command_list.append(cmd)
+
+        for alias in aliases:
+            commands[alias] = cmd
+
+        return handler
+
+    return decorator
+
+
+def command_arg(cmd, words):
+    if cmd.args == "none":
+        return None
+
+    arg = " ".join(clean_list(words))
+    arg = clean_gifmaker(arg)
+    return arg or None
+
+
+def media_arg(arg):
+    # A leading ^N picks the Nth newest file in the room instead of the last one
+    if not arg:
+        return 1, arg
+
+    words = arg.split(" ")
+    match = re.fullmatch(r"\^(\d+)", words[0])
+
+    if not match:
+        return 1, arg
+
+    return int(match.group(1)), " ".join(words[1:]) or None
+
+
+async def invoke(bot, cmd, arg, room_id):
+    render_cost.set(cmd.cost)
+    command_name.set(cmd.name)
+
+    with bot.metrics.stage("command"):
+        await cmd.handler(bot, arg, room_id)
+
+
+@command("ping", hidden=True)
+async def ping(bot, arg, room_id):
+    await bot.send_message("Pong!", room_id)
+
+
+@command("help", hidden=True)
+async def show_help(bot, arg, room_id):
+    names = [cmd.name for cmd in command_list if not cmd.hidden]
+    await bot.send_message(f"Commands: {' | '.join(names)}", room_id)
+
+
+@command("queue", hidden=True)
+async def show_queue(bot, arg, room_id):
+    await bot.send_message(bot.render_pool.status(), room_id)
+
+
+@command("describe", args="required", cooldown="render")
+async def gif_describe(bot, who, room_id):
+    command = gifmaker_command(
+        input=get_path("describe.jpg"),
+        words=f"{who} is\\n[Random] [x5]",
+        filter="anyhue2",
+        opacity=0.8,
+        fontsize=66,
+        delay=700,
+        padding=50,
+        fontcolor="light2",
+        bgcolor="black",
+    )
+
+    await run_gifmaker(bot, command, room_id)
+
+
+@command("wins", "win", args="optional", cooldown="render")
+async def gif_wins(bot, who, room_id):
+    if not who:
+        who = bot.presence.random(room_id)
+
+        if not who:
+            return
+
+    command = gifmaker_command(
+        input=get_path("wins.gif"),
+        words=f"{who} wins a ; [repeat] ; [RANDOM] ; [repeat]",
+        bgcolor="0,0,0",
+        bottom=20,
+        filter="anyhue2",
+        framelist="11,11,33,33",
+        fontsize=42,
+    )
+
+    await run_gifmaker(bot, command, room_id)
+
+
+@command(
+    "numbers",
+    "number",
+    "nums",
+    "num",
+    args="optional",
+    cooldown="render",
+    cost=cost_cheap,
+)
+async def gif_numbers(bot, arg, room_id):
+    num = -1
+
+    if arg:
+        nums = extract_range(arg)
+
+        if nums[0] is not None:
+            if nums[1] is not None:
+                if nums[0] < nums[1]:
+                    num = random_int(nums[0], nums[1])
+                else:
+                    return
+            else:
+                num = random_int(0, nums[0])
+
+        if num == -1:
+            num = string_to_number(arg)
+
+    if num == -1:
+        num = random_int(0, 999)
+
+    command = gifmaker_command(
+        input=get_path("numbers.png"),
+        top=20,
+        words=num,
+        fontcolor="0,0,0",
+        fontsize=66,
+        format="jpg",
+    )
+
+    await run_gifmaker(bot, command, room_id, cache=True)
+
+
+@command("date", "data", "time", "datetime", cooldown="render", cost=cost_cheap)
+async def gif_date(bot, arg, room_id):
+    command = gifmaker_command(
+        input=get_path("time.jpg"),
+        words="Date: [date %A %d] ; [repeat] ; Time: [date %I:%M %p] ; [repeat]",
+        filter="anyhue2",
+        bottom=20,
+        bgcolor="0,0,0",
+        fontsize=80,
+    )
+
+    minute = datetime.now().strftime("%Y-%m-%d %H:%M")
+    await run_gifmaker(bot, command, room_id, cache=True, seed=minute)
+
+
+@command("bird", "birds", "birb", "birbs", "brb")
+async def random_bird(bot, arg, room_id):
+    bird = random.choice(dataset("birds"))
+    await bot.send_message(f'.i "{bird}" bird', room_id)
+
+
+# One feed for all workers so the 4chan rate limit holds
+@command("shitpost", "post", "4chan", "anon", "shit", cooldown="fetch", gateway=True)
+async def shitpost(bot, arg, room_id):
+    board = random.choice(bot.chan_feed.boards)
+
+    try:
+        text = await bot.chan_feed.take(board)
+
+        if not text:
+            return
+
+        await bot.send_message(text, room_id)
+
+    except Exception as err:
+        msg(f"Error: {err}")
+
+
+@command("who", "pick", "any", "user", "username", args="optional", cooldown="render")
+async def gif_user(bot, who, room_id):
+    if not who:
+        who = bot.presence.random(room_id)
+
+        if not who:
+            return
+
+    what = random.choice(["based", "cringe"])
+
+    command = gifmaker_command(
+        input=get_path("nerd.jpg"),
+        words=f"{who} is [x2] ; {what} [x2]",
+        filter="anyhue2",
+        bottom=20,
+        fontcolor="light2",
+        bgcolor="darkfont2",
+        outline="font",
+        deepfry=True,
+        font="nova",
+        fontsize=45,
+        opacity=0.8,
+    )
+
+    await run_gifmaker(bot, command, room_id)
+
+
+@command("when", "die", "death", args="optional", cooldown="render")
+async def gif_when(bot, who, room_id):
+    if not who:
+        who = bot.presence.random(room_id)
+
+        if not who:
+            return
+
+    date = random_date()
+
+    command = gifmaker_command(
+        input=get_path("sky.jpg"),
+        words=f"{who} will die [x2] ; {date} [x2]",
+        filter="anyhue2",
+        bottom=66,
+        fontcolor="light2",
+        bgcolor="darkfont2",
+        outline="font",
+        font="nova",
+        fontsize=70,
+        opacity=0.8,
+        wrap=25,
+    )
+
+    await run_gifmaker(bot, command, room_id)
+
+
+@command("write", "writer", "words", "text", "meme", args="optional", cooldown="render")
+async def make_meme(bot, arg, room_id):
+    back, arg = media_arg(arg)
+    media = bot.recent_media.get(room_id, back)
+
+    if not media:
+        return
+
+    try:
+        link, ext = media
+
+        await bot.send_message("Generating gif...", room_id)
+
+        async with bot.media_cache.use(link, ext) as file_name:
+            if not file_name:
+                return
+
+            words = arg if arg else ""
+
+            if words == "random":
+                words = "[Random] [Random]"
+
+            command = gifmaker_command(
+                input=file_name,
+                words=words,
+                filter="anyhue2",
+                opacity=0.8,
+                fontsize=60,
+                delay=700,
+                padding=30,
+                fontcolor="light2",
+                bgcolor="black",
+                bottom=30,
+                font="nova",
+                frames=3,
+                fillgen=True,
+                word_color_mode="random",
+            )
+
+            await run_gifmaker(bot, command, room_id)
+
+    except Exception as e:
+        print("Error:", e)
+        return None
+
+
+@command("video", "vid", args="optional", cooldown="heavy", cost=cost_heavy)
+async def make_video(bot, arg, room_id):
+    back, arg = media_arg(arg)
+    media = bot.recent_media.get(room_id, back)
+
+    if not media:
+        return
+
+    try:
+        link, ext = media
+
+        await bot.send_message("Generating video...", room_id)
+
+        async with bot.media_cache.use(link, ext) as file_name:
+            if not file_name:
+                return
+
+            words = arg if arg else ""
+
+            if words == "random":
+                words = "[Random] [Random]"
+
+            command = gifmaker_command(
+                input=file_name,
+                words=words,
+                filter="anyhue2",
+                opacity=0.8,
+                fontsize=60,
+                delay=600,
+                padding=30,
+                fontcolor="light2",
+                bgcolor="black",
+                bottom=30,
+                font="nova",
+                frames=18,
+                fillgen=True,
+                word_color_mode="random",
+                width=600,
+                output="video.webm",
+            )
+
+            await run_gifmaker(bot, command, room_id)
+
+    except Exception as e:
+        print("Error:", e)
+        return None
+
+
+@command("where", "place", "going", args="optional", cooldown="render")
+async def gif_where(bot, who, room_id):
+    if not who:
+        who = bot.presence.random(room_id)
+
+        if not who:
+            return
+
+    place = random_country()
+
+    command = gifmaker_command(
+        input=get_path("place.jpg"),
+        words=f"{who} is going to [x2] ; {place} [x2]",
+        filter="anyhue2",
+        bottom=66,
+        fontcolor="light2",
+        bgcolor="darkfont2",
+        outline="font",
+        font="nova",
+        fontsize=70,
+        opacity=0.8,
+        wrap=25,
+    )
+
+    await run_gifmaker(bot, command, room_id)
+
+
+@command("gallo", "rooster", "chicken", args="optional", cooldown="render")
+async def gallo_gif(bot, arg, room_id):
+    command = gifmaker_command(
+        input=get_path("gallo.gif"),
+        words=arg,
+        fontsize=28,
+        delay=10,
+        fontcolor="black",
+        order="normal",
+        top=15,
+        frames=30,
+        fillwords=True,
+    )
+
+    await run_gifmaker(bot, command, room_id)
+
+
+@command("oracle", "fortune", args="optional", cooldown="heavy", cost=cost_heavy)
+async def oracle_video(bot, arg, room_id):
+    command = oracle_command([])
+    await run_oracle(bot, command, room_id)
@@ -0,0 +1,136 @@
+# Settings for the bot, edit them here or set them on this module before starting
+# Everything is read when it's used so changes after import still apply
+
+import os
+from pathlib import Path
+
+# The repo root, where the templates and data files are
+HERE = Path(__file__).resolve().parent.parent
+username = os.environ.get("GLUEBOT_USERNAME")
+password = os.environ.get("GLUEBOT_PASSWORD")
+
+headers = {
+    "User-Agent": "gluebot",
+    "Origin": "https://deek.chat",
+    "DNT": "1",
+}
+
+url = "https://deek.chat"
+ws_url = "wss://deek.chat/ws"
+prefix = ","
+numbers_seed = os.environ.get("GLUEBOT_NUMBERS_SEED", "gluebot")
+# Tokens a command takes from the user and room buckets, by cooldown class
+cooldown_costs = {"chat": 1, "fetch": 2, "render": 3, "heavy": 6}
+user_rate = (6, 1)
+room_rate = (12, 2)
+# Shared buckets per cooldown class to keep the render host from flooding
+class_rates = {"render": (8, 1), "heavy": (2, 0.1)}
+rate_max_wait = 15
+rate_max_entries = 1000
+max_tasks = 8
+room_queue_size = 20
+# Commands each room runs at once per lane, see Command in commands.py
+# Renders in one room can overlap and use more than one render worker
+room_lanes = {"chat": 1, "cheap": 1, "render": 4}
+# Seconds a reply waits for a reconnect before it's dropped
+send_wait = 10
+# Seconds a stopping bot waits for queued commands to finish
+drain_timeout = 30
+render_workers = os.cpu_count() or 1
+render_queue_size = 30
+render_max_wait = 90
+http_limit = 20
+http_keepalive = 60
+http_connect_timeout = 10
+http_read_timeout = 60
+media_dir = Path("/tmp/gifmaker-media")
+media_max_bytes = 512 * 1024 * 1024
+media_chunk_size = 256 * 1024
+# Files remembered per room for ,write and ,video, pick older ones with ^N
+recent_media_size = 10
+recent_media_rooms = 100
+render_dir = Path("/tmp/gifmaker-renders")
+render_cache_ttl = 60 * 60
+render_cache_bytes = 128 * 1024 * 1024
+upload_chunk_size = 256 * 1024
+# Stream gifmaker output through a fifo into the upload instead of a file
+# Renders that go into the render cache always use a file
+render_pipe = False
+upload_retries = 3
+upload_backoff = 1
+reconnect_min = 1
+reconnect_max = 120
+# A connection that lasted this long resets the backoff
+reconnect_reset = 60
+scratch_dir = Path("/tmp/gifmaker")
+scratch_max_age = 60 * 60
+# Where --mode gateway puts jobs and --mode worker takes them, see gluebot/jobs.py
+# Workers on other hosts need the same directory, like an NFS mount
+spool_dir = Path("/tmp/gluebot-spool")
+spool_poll = 0.1
+# Seconds a worker can go silent before its jobs go to another one
+spool_lease = 60
+spool_attempts = 3
+# Prometheus text on /metrics and JSON on /metrics.json, None turns it off
+metrics_host = "127.0.0.1"
+metrics_port = None
+# Path for a JSON snapshot written every metrics_interval seconds
+metrics_dump = None
+metrics_interval = 60
+metrics_buckets = (
+    0.0001,
+    0.0005,
+    0.001,
+    0.005,
+    0.01,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+    120,
+)
+chan_url = "https://a.4cdn.org"
+chan_boards = ["g", "an", "ck", "lit", "x", "tv", "v", "fit", "k", "o", "sci", "his"]
+chan_catalog_ttl = 60
+chan_pool_size = 3
+chan_post_ttl = 60 * 10
+# The 4chan API asks for at most one request per second
+chan_interval = 1
+snapshot_dir = Path(HERE, "data", "snapshots")
+
+gifmaker_path = "/home/joe/.local/bin/gifmaker"
+
+gifmaker_common = {
+    "width": 350,
+    "nogrow": True,
+}
+
+# Optional warm worker, see gluebot/worker.py
+# It has to run with the python that gifmaker is installed into
+gifmaker_worker = False
+gifmaker_python = "/home/joe/.local/pipx/venvs/gifmaker/bin/python"
+worker_timeout = 120
+worker_restart_delay = 5
+worker_template_dir = "/tmp/gifmaker-templates"
+# Decoded and resized to gifmaker_common's width when the worker starts
+worker_templates = [
+    "describe.jpg",
+    "gallo.gif",
+    "nerd.jpg",
+    "numbers.png",
+    "place.jpg",
+    "sky.jpg",
+    "time.jpg",
+    "wins.gif",
+]
+
+oracle_common = [
+    "node",
+    "/home/joe/oracle/video.js",
+]
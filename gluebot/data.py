@@ -0,0 +1,76 @@
+import json
+import pickle
+import random
+import sys
+from pathlib import Path
+
+from . import config
+from .utils import msg
+
+datasets = {}
+
+
+def load_birds(path):
+    with open(path, "r") as file:
+        return tuple(sys.intern(line.strip()) for line in file if line.strip())
+
+
+def load_countries(path):
+    with open(path, "r") as file:
+        return tuple(sys.intern(item["countryName"]) for item in json.load(file))
+
+
+# Only the fields the commands use are kept, as tuples of interned strings
+dataset_sources = {
+    "birds": ("data/aves.txt", load_birds),
+    "countries": ("data/places.json", load_countries),
+}
+
+
+def dataset(name):
+    data = datasets.get(name)
+
+    if data is None:
+        data = load_dataset(name)
+        datasets[name] = data
+
+    return data
+
+
+def load_dataset(name):
+    # Parsed data is pickled next to the sources and reused until they change
+    source, loader = dataset_sources[name]
+    path = Path(config.HERE, source)
+    stat = path.stat()
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    snapshot = Path(config.snapshot_dir, f"{name}.pickle")
+
+    try:
+        with open(snapshot, "rb") as file:
+            saved, data = pickle.load(file)
+
+        if saved == stamp:
+            return tuple(sys.intern(item) for item in data)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        msg(f"(Data) Bad snapshot for {name}: {e}")
+
+    data = loader(path)
+
+    try:
+        config.snapshot_dir.mkdir(parents=True, exist_ok=True)
+        temp = snapshot.with_suffix(".tmp")
+
+        with open(temp, "wb") as file:
+            pickle.dump((stamp, data), file, protocol=pickle.HIGHEST_PROTOCOL)
+
+        temp.replace(snapshot)
+    except Exception as e:
+        msg(f"(Data) Can't save snapshot for {name}: {e}")
+
+    return data
+
+
+def random_country():
+    return random.choice(dataset("countries"))
@@ -0,0 +1,100 @@
+import json
+
+try:
+    import orjson
+
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+
+class MessageEvent:
+    __slots__ = ("name", "text", "room_id")
+
+    def __init__(self, name, text, room_id):
+        self.name = name
+        self.text = text
+        self.room_id = room_id
+
+
+class FilesEvent:
+    __slots__ = ("name", "files", "room_id")
+
+    def __init__(self, name, files, room_id):
+        self.name = name
+        self.files = files
+        self.room_id = room_id
+
+
+class UsersEvent:
+    __slots__ = ("rooms",)
+
+    def __init__(self, rooms):
+        self.rooms = rooms
+
+
+class EnterEvent:
+    __slots__ = ("name", "room_id")
+
+    def __init__(self, name, room_id):
+        self.name = name
+        self.room_id = room_id
+
+
+class ExitEvent:
+    __slots__ = ("name", "room_id")
+
+    def __init__(self, name, room_id):
+        self.name = name
+        self.room_id = room_id
+
+
+def decode_frame(message):
+    # Each websocket frame is parsed once here, anything unknown becomes None
+    try:
+        data = json_loads(message)
+    except Exception:
+        return None
+
+    if not isinstance(data, dict):
+        return None
+
+    event = data.get("type")
+    dta = data.get("data")
+    room_id = data.get("roomId")
+
+    if event in ["message", "messageEnd"]:
+        if not isinstance(dta, dict):
+            return None
+
+        return MessageEvent(dta.get("name"), dta.get("text") or "", room_id)
+    elif event == "files":
+        if not isinstance(dta, dict):
+            return None
+
+        return FilesEvent(dta.get("name"), dta.get("files") or [], room_id)
+    elif event == "loadUsers":
+        if not isinstance(dta, dict):
+            return None
+
+        rooms = {}
+
+        for key, room_users in dta.items():
+            rooms[key] = [user.get("name") for user in room_users if user.get("name")]
+
+        return UsersEvent(rooms)
+    elif event in ["enter", "exit"]:
+        if not isinstance(dta, dict):
+            return None
+
+        name = dta.get("name")
+
+        if not name:
+            return None
+
+        if event == "enter":
+            return EnterEvent(name, room_id)
+
+        return ExitEvent(name, room_id)
+
+    return None
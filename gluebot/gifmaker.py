@@ -0,0 +1,220 @@
+import asyncio
+import itertools
+import json
+import time
+from pathlib import Path
+
+from . import config
+from .utils import clean_string, get_path, msg, remove_char
+
+
+# Options the gif commands are allowed to pass to gifmaker
+# Values of True become bare switches like --nogrow
+gifmaker_options = {
+    "input",
+    "output",
+    "words",
+    "width",
+    "nogrow",
+    "filter",
+    "opacity",
+    "fontsize",
+    "fontcolor",
+    "bgcolor",
+    "delay",
+    "padding",
+    "top",
+    "bottom",
+    "font",
+    "frames",
+    "framelist",
+    "fillgen",
+    "fillwords",
+    "word_color_mode",
+    "order",
+    "format",
+    "outline",
+    "deepfry",
+    "wrap",
+}
+
+
+def clean_gifmaker(arg):
+    arg = clean_string(arg)
+    arg = remove_char(arg, ";")
+    return arg
+
+
+def gifmaker_command(**options):
+    for key in options:
+        if key not in gifmaker_options:
+            raise ValueError(f"Unknown gifmaker option: {key}")
+
+    command = config.gifmaker_common.copy()
+    command.update(options)
+    return command
+
+
+def gifmaker_argv(command):
+    argv = [config.gifmaker_path]
+
+    for key, value in command.items():
+        if (value is None) or (value is False):
+            continue
+
+        flag = "--" + key.replace("_", "-")
+
+        if value is True:
+            argv.append(flag)
+            continue
+
+        value = str(value)
+
+        # Keep user text like "-5" from being read as another flag
+        if value.startswith("-"):
+            argv.append(f"{flag}={value}")
+        else:
+            argv.extend([flag, value])
+
+    return argv
+
+
+def oracle_command(args):
+    command = config.oracle_common.copy()
+    command.extend(str(arg) for arg in args)
+    return command
+
+
+class RenderWorker:
+    # Talks to gluebot/worker.py over its stdin and stdout, one JSON line per job
+    # If the worker dies it's started again on the next job, at most once
+    # every restart_delay seconds, jobs in between use a cold process
+    def __init__(self, argv, timeout, restart_delay):
+        self.argv = argv
+        self.timeout = timeout
+        self.restart_delay = restart_delay
+        self.process = None
+        self.reader = None
+        self.pending = {}
+        self.counter = itertools.count()
+        self.started = 0
+        self.lock = asyncio.Lock()
+
+    def alive(self):
+        return self.process and (self.process.returncode is None)
+
+    async def start(self):
+        async with self.lock:
+            if self.alive():
+                return True
+
+            if (time.monotonic() - self.started) < self.restart_delay:
+                return False
+
+            self.started = time.monotonic()
+
+            try:
+                self.process = await asyncio.create_subprocess_exec(
+                    *self.argv,
+                    stdin=asyncio.subprocess.PIPE,
+                    stdout=asyncio.subprocess.PIPE,
+                )
+            except Exception as e:
+                msg(f"(Worker) Error: {e}")
+                return False
+
+            self.reader = asyncio.create_task(self.read(self.process))
+            return True
+
+    async def read(self, process):
+        while True:
+            line = await process.stdout.readline()
+
+            if not line:
+                break
+
+            try:
+                data = json.loads(line)
+            except Exception:
+                continue
+
+            future = self.pending.pop(data.get("id"), None)
+
+            if future and (not future.done()):
+                future.set_result(data)
+
+        await process.wait()
+        msg(f"(Worker) Exited with code {process.returncode}")
+
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(Exception("Render worker exited"))
+
+        self.pending = {}
+
+    async def run(self, argv):
+        # Returns (code, stdout, stderr) or None if the worker couldn't take the job
+        # Only None means a cold process should try, a job the worker took
+        # may still be writing its output and is killed instead
+        if not await self.start():
+            return None
+
+        id = next(self.counter)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[id] = future
+        line = json.dumps({"id": id, "argv": [str(arg) for arg in argv]})
+
+        try:
+            self.process.stdin.write(line.encode() + b"\n")
+            await self.process.stdin.drain()
+        except Exception as e:
+            msg(f"(Worker) Error: {type(e).__name__}: {e}")
+            self.pending.pop(id, None)
+            return None
+
+        try:
+            data = await asyncio.wait_for(future, self.timeout)
+        except asyncio.CancelledError:
+            self.kill(id)
+            raise
+        except asyncio.TimeoutError:
+            self.kill(id)
+            return 1, "", f"Job timed out after {self.timeout}s"
+        except Exception as e:
+            self.kill(id)
+            return 1, "", f"{type(e).__name__}: {e}"
+        finally:
+            self.pending.pop(id, None)
+
+        return data["code"], data["stdout"], data["stderr"]
+
+    def kill(self, id):
+        # The worker kills the job's process group, gifmaker and what it started
+        if not self.alive():
+            return
+
+        try:
+            self.process.stdin.write(json.dumps({"kill": id}).encode() + b"\n")
+        except Exception as e:
+            msg(f"(Worker) Error: {type(e).__name__}: {e}")
+
+    async def close(self):
+        if self.alive():
+            self.process.stdin.close()
+
+            try:
+                await asyncio.wait_for(self.process.wait(), 5)
+            except asyncio.TimeoutError:
+                self.process.kill()
+
+        if self.reader:
+            await asyncio.gather(self.reader, return_exceptions=True)
+
+
+def worker_argv():
+    argv = [config.gifmaker_python, str(Path(Path(__file__).parent, "worker.py"))]
+    argv.extend(["--script", config.gifmaker_path])
+    argv.extend(["--width", str(config.gifmaker_common["width"])])
+    argv.extend(["--cache", config.worker_template_dir])
+    argv.extend(["--preload", *[get_path(name) for name in config.worker_templates]])
+    return argv
@@ -0,0 +1,259 @@
+import asyncio
+import time
+from pathlib import Path
+
+from . import config
+from .bot import Bot
+from .commands import commands, invoke
+from .queues import Dispatcher
+from .spool import Spool
+from .utils import msg
+
+
+class Gateway(Bot):
+    # Keeps the websocket and writes commands into the job spool
+    # Nothing renders here, JobWorkers take the jobs and upload the results
+    # Their text replies come back through the message spool
+    def __init__(self, username, password, spool, url=None, ws_url=None):
+        super().__init__(username, password, url, ws_url)
+        self.jobs = Spool(Path(spool, "jobs"))
+        self.messages = Spool(Path(spool, "messages"))
+        self.outbox = asyncio.Queue()
+        self.writing = 0
+        self.tasks = []
+
+    async def setup(self):
+        # Commands marked gateway=True run here, the rest go to the workers
+        self.dispatcher = Dispatcher(
+            config.max_tasks, config.room_queue_size, self.metrics, config.room_lanes
+        )
+
+        self.setup_chan()
+
+        self.tasks = [
+            asyncio.create_task(self.writer()),
+            asyncio.create_task(self.relay()),
+            asyncio.create_task(self.janitor()),
+        ]
+
+    def submit(self, cmd, user, arg, room_id, ready):
+        if cmd.gateway:
+            super().submit(cmd, user, arg, room_id, ready)
+            return
+
+        # The worker gets what the command reads from the room with the job
+        job = {
+            "command": cmd.name,
+            "arg": arg,
+            "room_id": room_id,
+            "user": user,
+            # Wall clock since workers can be on other hosts
+            "ready": time.time() + max(0, ready - time.monotonic()),
+            "users": self.presence.names(room_id),
+            "media": self.recent_media.items(room_id),
+        }
+
+        self.outbox.put_nowait(job)
+
+    async def writer(self):
+        # Spool writes leave the receive loop, on a shared mount each is a round trip
+        while True:
+            jobs = [await self.outbox.get()]
+
+            while not self.outbox.empty():
+                jobs.append(self.outbox.get_nowait())
+
+            self.writing = len(jobs)
+            failed = await asyncio.to_thread(self.write_jobs, jobs)
+            self.writing = 0
+
+            if failed:
+                labels = (("reason", "spool"),)
+                self.metrics.count("gluebot_dropped_total", labels, failed)
+
+    def write_jobs(self, jobs):
+        failed = 0
+
+        for job in jobs:
+            try:
+                self.jobs.put(job)
+            except Exception as e:
+                msg(f"(Gateway) Error: {e}")
+                failed += 1
+
+        return failed
+
+    async def relay(self):
+        # Sends the spooled replies while connected, they wait in the spool otherwise
+        while True:
+            await self.connected.wait()
+
+            item = await asyncio.to_thread(self.messages.claim)
+
+            if not item:
+                await asyncio.sleep(config.spool_poll)
+                continue
+
+            data, path = item
+
+            try:
+                await self.send_frame(data["text"], data["room_id"])
+                self.messages.finish(path)
+            except Exception as e:
+                msg(f"(Gateway) Error: {e}")
+                self.messages.release(path)
+                await asyncio.sleep(config.spool_poll)
+
+    async def janitor(self):
+        # Jobs of workers that died go back to the others
+        while True:
+            for spool in [self.jobs, self.messages]:
+                try:
+                    count = await asyncio.to_thread(
+                        spool.requeue, config.spool_lease, config.spool_attempts
+                    )
+
+                    if count:
+                        msg(f"(Gateway) Requeued {count} from {spool.root.name}")
+                except Exception as e:
+                    msg(f"(Gateway) Error: {e}")
+
+            await asyncio.sleep(config.spool_lease / 4)
+
+    def collect_gauges(self):
+        super().collect_gauges()
+        self.metrics.set("gluebot_spool_jobs", (), self.jobs.pending())
+        self.metrics.set("gluebot_spool_claimed", (), self.jobs.claims())
+
+    async def drain(self, timeout=None):
+        # Waits for the local commands, the claimed jobs and their replies
+        # Unclaimed jobs stay in the spool for the next start
+        self.accepting = False
+
+        try:
+            await asyncio.wait_for(self.settle(), timeout)
+        except asyncio.TimeoutError:
+            msg("(Gateway) Drain timed out, the rest stays in the spool")
+
+    async def settle(self):
+        await self.dispatcher.join()
+
+        while self.outbox.qsize() or self.writing:
+            await asyncio.sleep(config.spool_poll)
+
+        while self.jobs.claims() or self.messages.pending():
+            await asyncio.sleep(config.spool_poll)
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        await super().stop()
+
+
+class JobWorker(Bot):
+    # Takes jobs from the spool, renders and uploads them with its own login
+    # Text replies go to the message spool for the Gateway to send
+    # Any number of them can share a spool, on one host or a shared directory
+    def __init__(self, username, password, spool, url=None, ws_url=None):
+        super().__init__(username, password, url, ws_url)
+        self.jobs = Spool(Path(spool, "jobs"))
+        self.messages = Spool(Path(spool, "messages"))
+        self.running = set()
+
+    async def setup(self):
+        # The 4chan feed stays in the gateway
+        await self.setup_render()
+
+    async def serve(self):
+        # Uploads log in again through reauth() when the session expires
+        async with self.auth_lock:
+            await self.login()
+
+        while True:
+            # Only claims what it can start so idle workers get the rest
+            if self.accepting and (len(self.running) < config.max_tasks):
+                item = await asyncio.to_thread(self.jobs.claim)
+
+                if item and (not self.accepting):
+                    self.jobs.release(item[1])
+                elif item:
+                    task = asyncio.create_task(self.work(*item))
+                    self.running.add(task)
+                    task.add_done_callback(self.running.discard)
+                    continue
+
+            await asyncio.sleep(config.spool_poll)
+
+    async def work(self, data, path):
+        heartbeat = asyncio.create_task(self.heartbeat(path))
+        done = False
+
+        try:
+            cmd = commands.get(data.get("command"))
+            room_id = data.get("room_id")
+            wait = data.get("ready", 0) - time.time()
+
+            # Same limit as the render queue, a late reply is worse than none
+            if -wait > config.render_max_wait:
+                reason = (("reason", "spool_wait"),)
+                self.metrics.count("gluebot_dropped_total", reason)
+                msg(f"(Worker) Dropping {data.get('command')}, it waited too long")
+                cmd = None
+            elif wait > 0:
+                await asyncio.sleep(wait)
+
+            if cmd:
+                self.presence.set(room_id, data.get("users", []))
+                self.recent_media.set(room_id, data.get("media", []))
+                await invoke(self, cmd, data.get("arg"), room_id)
+
+            done = True
+        except Exception as e:
+            msg(f"(Worker) Error: {e}")
+            done = True
+        finally:
+            heartbeat.cancel()
+
+            # Cancelled jobs go back for another worker
+            if done:
+                self.jobs.finish(path)
+            else:
+                self.jobs.release(path)
+
+    async def heartbeat(self, path):
+        while True:
+            await asyncio.sleep(config.spool_lease / 3)
+
+            if not self.jobs.touch(path):
+                msg(f"(Worker) Lost the lease on {path.name}")
+                return
+
+    async def send_message(self, text, room_id):
+        data = {"text": text, "room_id": room_id}
+
+        with self.metrics.stage("send"):
+            await asyncio.to_thread(self.messages.put, data)
+
+    async def drain(self, timeout=None):
+        self.accepting = False
+
+        if not self.running:
+            return
+
+        done, pending = await asyncio.wait(list(self.running), timeout=timeout)
+
+        if pending:
+            msg("(Worker) Drain timed out, the rest goes back to the spool")
+
+    async def stop(self):
+        self.accepting = False
+        tasks = list(self.running)
+
+        for task in tasks:
+            task.cancel()
+
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await super().stop()
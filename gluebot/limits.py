@@ -0,0 +1,93 @@
+import time
+from collections import OrderedDict
+
+from . import config
+
+
+class Bucket:
+    __slots__ = ("tokens", "date")
+
+    def __init__(self, tokens, date):
+        self.tokens = tokens
+        self.date = date
+
+
+class RateLimiter:
+    # Token buckets by key, kept in least recently used order
+    # Buckets that refilled completely are the same as missing ones and get dropped
+    def __init__(self, capacity, rate, max_entries):
+        self.capacity = capacity
+        self.rate = rate
+        self.max_entries = max_entries
+        self.buckets = OrderedDict()
+
+    def level(self, key, now):
+        bucket = self.buckets.get(key)
+
+        if bucket is None:
+            return self.capacity
+
+        return min(self.capacity, bucket.tokens + (now - bucket.date) * self.rate)
+
+    def wait_time(self, key, amount, now):
+        missing = amount - self.level(key, now)
+        return max(0, missing / self.rate)
+
+    def take(self, key, amount, now):
+        # Tokens can go negative, that's a reservation for a queued command
+        tokens = self.level(key, now) - amount
+        bucket = self.buckets.get(key)
+
+        if bucket is None:
+            self.buckets[key] = Bucket(tokens, now)
+        else:
+            bucket.tokens = tokens
+            bucket.date = now
+            self.buckets.move_to_end(key)
+
+        self.trim(now)
+
+    def trim(self, now):
+        while len(self.buckets) > self.max_entries:
+            self.buckets.popitem(last=False)
+
+        while self.buckets:
+            key = next(iter(self.buckets))
+
+            if self.level(key, now) < self.capacity:
+                break
+
+            del self.buckets[key]
+
+
+class Limits:
+    # The user, room and cooldown class buckets of one bot
+    def __init__(self):
+        self.user = RateLimiter(*config.user_rate, config.rate_max_entries)
+        self.room = RateLimiter(*config.room_rate, config.rate_max_entries)
+
+        self.classes = {
+            name: RateLimiter(*rate, 1) for name, rate in config.class_rates.items()
+        }
+
+    def reserve(self, user, room_id, cooldown):
+        # Returns when the command may run, or None if it would wait too long
+        now = time.monotonic()
+        amount = config.cooldown_costs[cooldown]
+        limiter = self.classes.get(cooldown)
+        wait = self.user.wait_time(user, amount, now)
+        wait = max(wait, self.room.wait_time(room_id, amount, now))
+
+        if limiter:
+            wait = max(wait, limiter.wait_time(cooldown, 1, now))
+
+        if wait > config.rate_max_wait:
+            return None
+
+        self.user.take(user, amount, now)
+        self.room.take(room_id, amount, now)
+
+        if limiter:
+            limiter.take(cooldown, 1, now)
+
+        return now + wait
@@ -0,0 +1,43 @@
+from collections import OrderedDict, deque
+
+
+class RecentMedia:
+    # The last few files posted in each room as (link, ext), newest last
+    # Rooms that haven't seen a file in a while are dropped past max_rooms
+    def __init__(self, size, max_rooms):
+        self.size = size
+        self.max_rooms = max_rooms
+        self.rooms = OrderedDict()
+
+    def add(self, room_id, link, ext):
+        key = str(room_id)
+        ring = self.rooms.get(key)
+
+        if ring is None:
+            ring = deque(maxlen=self.size)
+            self.rooms[key] = ring
+
+            while len(self.rooms) > self.max_rooms:
+                self.rooms.popitem(last=False)
+        else:
+            self.rooms.move_to_end(key)
+
+        ring.append((link, ext))
+
+    def items(self, room_id):
+        return list(self.rooms.get(str(room_id), ()))
+
+    def set(self, room_id, items):
+        self.rooms.pop(str(room_id), None)
+
+        for link, ext in items:
+            self.add(room_id, link, ext)
+
+    def get(self, room_id, back=1):
+        # back=1 is the newest file, 2 the one before it and so on
+        ring = self.rooms.get(str(room_id))
+
+        if (not ring) or (back < 1) or (back > len(ring)):
+            return None
+
+        return ring[-back]
@@ -0,0 +1,180 @@
+import asyncio
+import bisect
+import contextvars
+import json
+import time
+from pathlib import Path
+
+from .utils import get_time, msg
+
+# Set by invoke() so every stage knows which command it's part of
+command_name = contextvars.ContextVar("command_name", default="none")
+
+
+class Metrics:
+    # Counters, gauges and latency histograms in plain dicts
+    # Keys are (name, labels) with labels as a tuple of pairs
+    # Histograms are [bucket counts..., overflow, sum] and only cumulated on export
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def count(self, name, labels=(), value=1):
+        key = (name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, labels, value):
+        self.gauges[(name, labels)] = value
+
+    def add(self, name, labels, value):
+        key = (name, labels)
+        self.gauges[key] = self.gauges.get(key, 0) + value
+
+    def observe(self, name, labels, seconds):
+        key = (name, labels)
+        hist = self.histograms.get(key)
+
+        if hist is None:
+            hist = [0] * (len(self.buckets) + 2)
+            self.histograms[key] = hist
+
+        hist[bisect.bisect_left(self.buckets, seconds)] += 1
+        hist[-1] += seconds
+
+    def stage(self, name):
+        return Stage(self, name)
+
+    def prometheus(self):
+        # Sorted as strings since label values can be numbers or None
+        lines = []
+        types = set()
+
+        def header(name, kind):
+            if name not in types:
+                types.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in sorted(self.counters.items(), key=str):
+            header(name, "counter")
+            lines.append(f"{name}{prom_labels(labels)} {value}")
+
+        for (name, labels), value in sorted(self.gauges.items(), key=str):
+            header(name, "gauge")
+            lines.append(f"{name}{prom_labels(labels)} {value}")
+
+        for (name, labels), hist in sorted(self.histograms.items(), key=str):
+            header(name, "histogram")
+            total = 0
+
+            for bound, hits in zip(self.buckets, hist):
+                total += hits
+                le = prom_labels(labels + (("le", bound),))
+                lines.append(f"{name}_bucket{le} {total}")
+
+            total += hist[-2]
+            le = prom_labels(labels + (("le", "+Inf"),))
+            lines.append(f"{name}_bucket{le} {total}")
+            lines.append(f"{name}_sum{prom_labels(labels)} {hist[-1]:.6f}")
+            lines.append(f"{name}_count{prom_labels(labels)} {total}")
+
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        def entries(items, func):
+            return [
+                {"name": name, "labels": dict(labels), **func(value)}
+                for (name, labels), value in items
+            ]
+
+        def hist(value):
+            return {
+                "buckets": dict(zip(map(str, self.buckets), value)),
+                "over": value[-2],
+                "count": sum(value[:-1]),
+                "sum": value[-1],
+            }
+
+        return {
+            "date": get_time(),
+            "counters": entries(self.counters.items(), lambda v: {"value": v}),
+            "gauges": entries(self.gauges.items(), lambda v: {"value": v}),
+            "histograms": entries(self.histograms.items(), hist),
+        }
+
+
+class Stage:
+    # with metrics.stage("upload"): records the latency and an in-flight gauge
+    # The command comes from the context of the task that runs it
+    __slots__ = ("metrics", "labels", "started")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.labels = (("stage", name), ("command", command_name.get()))
+
+    def __enter__(self):
+        self.metrics.add("gluebot_inflight", self.labels[:1], 1)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        self.metrics.observe("gluebot_stage_seconds", self.labels, elapsed)
+        self.metrics.add("gluebot_inflight", self.labels[:1], -1)
+        return False
+
+
+def prom_labels(labels):
+    if not labels:
+        return ""
+
+    items = []
+
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+        value = value.replace("\n", "\\n")
+        items.append(f'{key}="{value}"')
+
+    return "{" + ",".join(items) + "}"
+
+
+async def start_metrics(metrics, collect, host, port):
+    # collect updates the gauges that are only read when scraped
+    from aiohttp import web
+
+    async def text(request):
+        collect()
+        ctype = "text/plain; version=0.0.4; charset=utf-8"
+        return web.Response(body=metrics.prometheus(), headers={"Content-Type": ctype})
+
+    async def snapshot(request):
+        collect()
+        return web.json_response(metrics.snapshot())
+
+    app = web.Application()
+    app.router.add_get("/metrics", text)
+    app.router.add_get("/metrics.json", snapshot)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    msg(f"(Metrics) Serving on {host}:{port}")
+    return runner
+
+
+def write_metrics(path, data):
+    path = Path(path)
+    temp = path.with_suffix(".tmp")
+    temp.write_text(json.dumps(data))
+    temp.replace(path)
+
+
+async def dump_metrics(metrics, collect, path, interval):
+    while True:
+        await asyncio.sleep(interval)
+        collect()
+
+        try:
+            await asyncio.to_thread(write_metrics, path, metrics.snapshot())
+        except Exception as e:
+            msg(f"(Metrics) Error: {e}")
@@ -0,0 +1,84 @@
+import random
+
+
+class RoomUsers:
+    # A list for random picks plus name positions for swap removal
+    __slots__ = ("names", "index")
+
+    def __init__(self):
+        self.names = []
+        self.index = {}
+
+    def add(self, name):
+        if name in self.index:
+            return
+
+        self.index[name] = len(self.names)
+        self.names.append(name)
+
+    def remove(self, name):
+        pos = self.index.pop(name, None)
+
+        if pos is None:
+            return
+
+        last = self.names.pop()
+
+        if pos < len(self.names):
+            self.names[pos] = last
+            self.index[last] = pos
+
+
+class Presence:
+    def __init__(self):
+        self.rooms = {}
+
+    def load(self, rooms):
+        self.rooms = {}
+
+        for room_id, names in rooms.items():
+            for name in names:
+                self.add(room_id, name)
+
+    def set(self, room_id, names):
+        # Replaces one room, the job workers get their rooms this way
+        room = RoomUsers()
+
+        for name in names:
+            room.add(name)
+
+        self.rooms[str(room_id)] = room
+
+    def names(self, room_id):
+        room = self.rooms.get(str(room_id))
+        return list(room.names) if room else []
+
+    def add(self, room_id, name):
+        key = str(room_id)
+        room = self.rooms.get(key)
+
+        if room is None:
+            room = RoomUsers()
+            self.rooms[key] = room
+
+        room.add(name)
+
+    def remove(self, room_id, name):
+        if room_id is None:
+            for room in self.rooms.values():
+                room.remove(name)
+
+            return
+
+        room = self.rooms.get(str(room_id))
+
+        if room:
+            room.remove(name)
+
+    def random(self, room_id):
+        room = self.rooms.get(str(room_id))
+
+        if (not room) or (not room.names):
+            return None
+
+        return random.choice(room.names)
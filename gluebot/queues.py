@@ -0,0 +1,223 @@
+import asyncio
+import itertools
+import time
+import traceback
+
+from .metrics import command_name
+from .utils import get_time, msg
+
+dispatch_wait = (("stage", "dispatch_wait"), ("command", "none"))
+
+
+class Dispatcher:
+    # Runs command coroutines in the background so the receive loop never waits
+    # Each room gets a queue per lane, lanes maps a lane to how many of its
+    # commands run at once, a lane with 1 keeps its commands in order
+    # A semaphore caps total concurrency
+    # Rate limited commands wait outside the room queue until they're ready
+    # so one user over their limit doesn't hold up everyone else in the room
+    def __init__(self, limit, queue_size, metrics, lanes=None):
+        self.metrics = metrics
+        self.semaphore = asyncio.Semaphore(limit)
+        self.queue_size = queue_size
+        self.lanes = lanes or {}
+        self.queues = {}
+        self.workers = {}
+        self.delayed = {}
+        self.counter = itertools.count()
+        self.idle = asyncio.Event()
+        self.idle.set()
+
+    def submit(self, room_id, coro, ready=0, lane=None):
+        wait = ready - time.monotonic()
+        lane_key = (room_id, lane)
+
+        if wait > 0:
+            key = next(self.counter)
+            loop = asyncio.get_running_loop()
+            handle = loop.call_later(wait, self.release, key, lane_key, ready)
+            self.delayed[key] = (handle, coro)
+            self.idle.clear()
+            return
+
+        self.enqueue(lane_key, coro, max(ready, time.monotonic()))
+
+    def release(self, key, lane_key, ready):
+        handle, coro = self.delayed.pop(key)
+        self.enqueue(lane_key, coro, ready)
+
+        if not self.delayed:
+            self.idle.set()
+
+    def enqueue(self, lane_key, coro, ready):
+        room_id, lane = lane_key
+        queue = self.queues.get(lane_key)
+
+        if queue is None:
+            queue = asyncio.Queue(maxsize=self.queue_size)
+            self.queues[lane_key] = queue
+
+            self.workers[lane_key] = [
+                asyncio.create_task(self.work(queue))
+                for _ in range(self.lanes.get(lane, 1))
+            ]
+
+        try:
+            queue.put_nowait((coro, ready))
+        except asyncio.QueueFull:
+            self.metrics.count("gluebot_dropped_total", (("reason", "room_queue"),))
+            msg(f"(Dispatch) Queue full in room {room_id}, dropping command")
+            coro.close()
+
+    async def work(self, queue):
+        while True:
+            coro, ready = await queue.get()
+
+            try:
+                async with self.semaphore:
+                    elapsed = time.monotonic() - ready
+                    labels = dispatch_wait
+                    self.metrics.observe("gluebot_stage_seconds", labels, elapsed)
+                    await coro
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                msg(f"(Dispatch) Error: {e}")
+                traceback.print_exc()
+            finally:
+                queue.task_done()
+
+    def queued(self):
+        waiting = sum(queue.qsize() for queue in self.queues.values())
+        return waiting + len(self.delayed)
+
+    async def join(self):
+        # Waits until every command that was submitted so far has finished
+        await self.idle.wait()
+        await asyncio.gather(*[queue.join() for queue in self.queues.values()])
+
+    async def close(self):
+        for handle, coro in self.delayed.values():
+            handle.cancel()
+            coro.close()
+
+        self.delayed = {}
+        self.idle.set()
+        tasks = [task for tasks in self.workers.values() for task in tasks]
+
+        for task in tasks:
+            task.cancel()
+
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        for queue in self.queues.values():
+            while not queue.empty():
+                queue.get_nowait()[0].close()
+
+        self.queues = {}
+        self.workers = {}
+
+
+class RenderPool:
+    # Fixed number of render slots fed by a bounded priority queue
+    # Jobs that waited longer than max_wait are dropped instead of rendered
+    def __init__(self, workers, queue_size, max_wait, metrics):
+        self.metrics = metrics
+        self.queue = asyncio.PriorityQueue(maxsize=queue_size)
+        self.max_wait = max_wait
+        self.counter = itertools.count()
+        self.workers = workers
+        self.running = 0
+        self.dropped = 0
+        self.tasks = [asyncio.create_task(self.work()) for _ in range(workers)]
+
+    def depth(self):
+        return self.queue.qsize()
+
+    def gauges(self):
+        self.metrics.set("gluebot_render_running", (), self.running)
+        self.metrics.set("gluebot_render_queued", (), self.depth())
+
+    def status(self):
+        waiting = f"{self.depth()} waiting"
+        running = f"{self.running}/{self.workers} running"
+        return f"Render queue: {waiting} | {running} | {self.dropped} dropped"
+
+    async def run(self, cost, func):
+        future = asyncio.get_running_loop().create_future()
+        name = command_name.get()
+        job = (cost, next(self.counter), get_time(), func, future, name)
+
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            self.metrics.count("gluebot_dropped_total", (("reason", "render_queue"),))
+            msg(f"(Render) Queue full ({self.depth()}), dropping job")
+            return None
+
+        return await future
+
+    async def work(self):
+        while True:
+            cost, _, date, func, future, name = await self.queue.get()
+
+            try:
+                if future.done():
+                    continue
+
+                # Stages inside the job are labeled with the command that queued it
+                command_name.set(name)
+                waited = get_time() - date
+                labels = (("stage", "render_wait"), ("command", name))
+                self.metrics.observe("gluebot_stage_seconds", labels, waited)
+
+                if waited > self.max_wait:
+                    self.dropped += 1
+                    labels = (("reason", "render_wait"),)
+                    self.metrics.count("gluebot_dropped_total", labels)
+                    msg("(Render) Job waited too long, dropping it")
+                    future.set_result(None)
+                    continue
+
+                self.running += 1
+                task = asyncio.create_task(func())
+
+                # A caller that gives up takes its render down with it
+                future.add_done_callback(
+                    lambda done, task=task: task.cancel() if done.cancelled() else None
+                )
+
+                try:
+                    await asyncio.wait([task])
+                except asyncio.CancelledError:
+                    task.cancel()
+                    future.cancel()
+                    raise
+                finally:
+                    self.running -= 1
+
+                if task.cancelled():
+                    future.cancel()
+                    continue
+
+                error = task.exception()
+
+                if future.done():
+                    continue
+
+                if error:
+                    future.set_exception(error)
+                else:
+                    future.set_result(task.result())
+            finally:
+                self.queue.task_done()
+
+    async def close(self):
+        for task in self.tasks:
+            task.cancel()
+
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+        while not self.queue.empty():
+            self.queue.get_nowait()[4].cancel()
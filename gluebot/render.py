@@ -0,0 +1,239 @@
+import asyncio
+import contextvars
+import os
+import shutil
+import tempfile
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+from . import config
+from .cache import render_key
+from .gifmaker import gifmaker_argv
+from .upload import UploadNotSent, upload, upload_stream
+from .utils import get_time, msg, remove_file
+
+# Render priorities, lower values leave the queue first
+cost_cheap = 0
+cost_normal = 1
+cost_heavy = 2
+# Set by invoke() from the command's cost
+render_cost = contextvars.ContextVar("render_cost", default=cost_normal)
+
+
+@asynccontextmanager
+async def scratch_job():
+    # Every render gets its own directory so parallel jobs never share paths
+    config.scratch_dir.mkdir(parents=True, exist_ok=True)
+    path = Path(tempfile.mkdtemp(prefix="job-", dir=config.scratch_dir))
+
+    try:
+        yield path
+    finally:
+        await asyncio.to_thread(shutil.rmtree, path, ignore_errors=True)
+
+
+def sweep_scratch():
+    config.scratch_dir.mkdir(parents=True, exist_ok=True)
+    limit = get_time() - config.scratch_max_age
+
+    for path in config.scratch_dir.iterdir():
+        try:
+            if path.lstat().st_mtime > limit:
+                continue
+
+            if path.is_dir() and (not path.is_symlink()):
+                shutil.rmtree(path)
+            else:
+                path.unlink()
+        except Exception as e:
+            msg(f"(Sweep) Error: {e}")
+
+
+async def run_gifmaker(bot, command, room_id, cost=None, cache=False, seed=None):
+    # Commands whose output only depends on their options can pass cache=True
+    # The seed holds anything else the output depends on, like the minute
+    key = None
+
+    if cost is None:
+        cost = render_cost.get()
+
+    if cache:
+        key = render_key(command, seed)
+        path = bot.render_cache.get(key)
+
+        if path:
+            await upload(bot, path, room_id)
+            return
+
+    await bot.render_pool.run(
+        cost, lambda: render_gifmaker(bot, command, room_id, key)
+    )
+
+
+async def run_oracle(bot, command, room_id):
+    await bot.render_pool.run(
+        render_cost.get(), lambda: render_oracle(bot, command, room_id)
+    )
+
+
+async def run_process(argv, cwd=None):
+    process = await asyncio.create_subprocess_exec(
+        *argv,
+        cwd=cwd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+
+    try:
+        stdout, stderr = await process.communicate()
+    except asyncio.CancelledError:
+        # A cancelled render doesn't leave the process running
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+
+        raise
+
+    if process.returncode != 0:
+        msg(f"(Process) Error: {stderr.decode()}")
+        return None
+
+    return stdout.decode().strip()
+
+
+async def run_gifmaker_process(bot, argv):
+    if bot.render_worker:
+        result = await bot.render_worker.run(argv)
+
+        if result:
+            code, stdout, stderr = result
+
+            if code != 0:
+                msg(f"(Process) Error: {stderr}")
+                return None
+
+            return stdout.strip()
+
+    return await run_process(argv)
+
+
+async def render_gifmaker(bot, command, room_id, key=None):
+    # Only a piped render that posted nothing is tried again with a file
+    if config.render_pipe and (not key):
+        if await render_piped(bot, command, room_id):
+            return
+
+        msg("(Render) Pipe render sent nothing, rendering to a file")
+
+    async with scratch_job() as job:
+        command = command.copy()
+        command["output"] = str(Path(job, command.get("output", "")))
+
+        with bot.metrics.stage("render"):
+            output = await run_gifmaker_process(bot, gifmaker_argv(command))
+
+        if not output:
+            return
+
+        # The path is the last line, tools gifmaker runs may print before it
+        path = Path(output.splitlines()[-1])
+
+        if key and path.is_file():
+            bot.render_cache.put(key, path)
+
+        await upload(bot, path, room_id)
+
+
+async def render_piped(bot, command, room_id):
+    # gifmaker writes into a fifo named like the file it would have made
+    # We keep a write end open ourselves so the reader only sees EOF
+    # once the process has exited, no matter when it opens the fifo
+    loop = asyncio.get_running_loop()
+
+    async with scratch_job() as job:
+        name = command.get("output") or f"render.{command.get('format', 'gif')}"
+        fifo = Path(job, name)
+        os.mkfifo(fifo)
+        command = command.copy()
+        command["output"] = str(fifo)
+        read_fd = os.open(fifo, os.O_RDONLY | os.O_NONBLOCK)
+        hold_fd = os.open(fifo, os.O_WRONLY | os.O_NONBLOCK)
+        stream = asyncio.StreamReader(limit=config.upload_chunk_size)
+
+        transport, _ = await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(stream), os.fdopen(read_fd, "rb", 0)
+        )
+
+        process = None
+
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *gifmaker_argv(command),
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+
+            result = asyncio.create_task(process.communicate())
+            result.add_done_callback(lambda _, fd=hold_fd: os.close(fd))
+            hold_fd = None
+            first = await stream.read(config.upload_chunk_size)
+
+            if not first:
+                stdout, stderr = await result
+
+                if process.returncode != 0:
+                    msg(f"(Process) Error: {stderr.decode()}")
+
+                return False
+
+            async def chunks():
+                yield first
+
+                while True:
+                    chunk = await stream.read(config.upload_chunk_size)
+
+                    if not chunk:
+                        break
+
+                    yield chunk
+
+                # A failed render aborts the request instead of posting a broken file
+                stdout, stderr = await result
+
+                if process.returncode != 0:
+                    raise Exception(f"gifmaker failed: {stderr.decode()}")
+
+            try:
+                with bot.metrics.stage("render_upload"):
+                    await upload_stream(bot, chunks(), name, room_id)
+            except UploadNotSent as e:
+                msg(f"(Render) Upload not sent: {e}")
+                return False
+
+            # Sent or maybe sent, a second try could post it twice
+            return True
+        finally:
+            transport.close()
+
+            if hold_fd is not None:
+                os.close(hold_fd)
+
+            if process and (process.returncode is None):
+                process.kill()
+                await process.wait()
+
+
+async def render_oracle(bot, command, room_id):
+    # The script writes where it runs and prints the path, relative or not
+    # Its own directory keeps parallel jobs from writing the same file
+    async with scratch_job() as job:
+        with bot.metrics.stage("render"):
+            output = await run_process(command, cwd=job)
+
+        if output:
+            path = Path(job, output)
+            await upload(bot, path, room_id)
+
+            # The job directory only cleans up what's inside it
+            if not path.resolve().is_relative_to(job.resolve()):
+                await asyncio.to_thread(remove_file, path)
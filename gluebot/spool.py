@@ -0,0 +1,123 @@
+import json
+import os
+import time
+import uuid
+from pathlib import Path
+
+from .utils import msg
+
+
+class Spool:
+    # A directory queue of JSON files that several processes can share
+    # put() writes into tmp/ and renames into new/ so readers never see half a file
+    # claim() renames the oldest file from new/ into claimed/, only one claimer wins
+    # A claim is a lease on the file's mtime, touch() renews it while working
+    # requeue() puts claims that stopped being renewed back into new/
+    def __init__(self, root):
+        self.root = Path(root)
+        self.tmp = Path(self.root, "tmp")
+        self.new = Path(self.root, "new")
+        self.claimed = Path(self.root, "claimed")
+        self.failed = Path(self.root, "failed")
+
+        for path in [self.tmp, self.new, self.claimed, self.failed]:
+            path.mkdir(parents=True, exist_ok=True)
+
+    def put(self, data, name=None, target=None):
+        # Names start with the time so new/ sorts oldest first
+        name = name or f"{time.time_ns():020d}-{uuid.uuid4().hex[:12]}.json"
+        temp = Path(self.tmp, name)
+
+        with open(temp, "w") as file:
+            json.dump(data, file)
+
+        os.replace(temp, Path(target or self.new, name))
+        return name
+
+    def claim(self):
+        # Returns (data, path) or None when there's nothing to do
+        for name in sorted(os.listdir(self.new)):
+            source = Path(self.new, name)
+            path = Path(self.claimed, name)
+
+            try:
+                # The lease starts now, not when the job was queued
+                os.utime(source)
+                os.rename(source, path)
+            except FileNotFoundError:
+                continue
+
+            try:
+                with open(path, "r") as file:
+                    return json.load(file), path
+            except FileNotFoundError:
+                continue
+            except Exception as e:
+                msg(f"(Spool) Bad file {name}: {e}")
+                os.replace(path, Path(self.failed, name))
+
+        return None
+
+    def pending(self):
+        return len(os.listdir(self.new))
+
+    def claims(self):
+        return len(os.listdir(self.claimed))
+
+    def touch(self, path):
+        # False once the lease was lost to requeue()
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def finish(self, path):
+        path.unlink(missing_ok=True)
+
+    def release(self, path):
+        # Gives a claim back right away, for jobs that didn't start
+        try:
+            os.rename(path, Path(self.new, path.name))
+        except FileNotFoundError:
+            pass
+
+    def requeue(self, lease, attempts):
+        # Claims older than lease seconds go back to new/ under the same name
+        # so they keep their place, after attempts tries they go to failed/
+        limit = time.time() - lease
+        count = 0
+
+        for name in os.listdir(self.claimed):
+            path = Path(self.claimed, name)
+            temp = Path(self.tmp, name + ".requeue")
+
+            try:
+                if path.stat().st_mtime > limit:
+                    continue
+
+                # Taken out of claimed/ first so a late finish() can't race the copy
+                os.rename(path, temp)
+            except FileNotFoundError:
+                continue
+
+            try:
+                with open(temp, "r") as file:
+                    data = json.load(file)
+            except Exception as e:
+                msg(f"(Spool) Bad file {name}: {e}")
+                os.replace(temp, Path(self.failed, name))
+                continue
+
+            data["attempts"] = data.get("attempts", 0) + 1
+
+            if data["attempts"] > attempts:
+                msg(f"(Spool) Giving up on {name}")
+                self.put(data, name, self.failed)
+            else:
+                self.put(data, name)
+                count += 1
+
+            temp.unlink(missing_ok=True)
+
+        return count
@@ -0,0 +1,158 @@
+import asyncio
+import time
+import traceback
+from pathlib import Path
+
+import aiofiles
+import aiohttp
+
+from . import config
+from .utils import get_extension, msg
+
+
+class FilePayload(aiohttp.payload.Payload):
+    # Streams a file into the request body with async reads
+    # The file is only open while the body is being written
+    def __init__(self, path, size, **kwargs):
+        super().__init__(path, **kwargs)
+        self._size = size
+
+    async def write(self, writer):
+        async with aiofiles.open(self._value, "rb") as file:
+            while True:
+                chunk = await file.read(config.upload_chunk_size)
+
+                if not chunk:
+                    break
+
+                await writer.write(chunk)
+
+    def decode(self, encoding="utf-8", errors="strict"):
+        return Path(self._value).read_bytes().decode(encoding, errors)
+
+
+def media_type(path):
+    ext = get_extension(path)
+    ext = "jpeg" if ext == "jpg" else ext
+
+    if ext in ["webm", "mp4"]:
+        return f"video/{ext}"
+
+    return f"image/{ext}"
+
+
+# Only failures before the request went out are retried, a post that timed out
+# or was cut off may have gone through and /message/send isn't idempotent
+# Same for statuses, only the ones a proxy sends when the app never saw the post
+connect_errors = (aiohttp.ClientConnectorError,)
+retry_statuses = [502, 503, 504]
+
+# aiohttp 3.10 and later tell connect timeouts apart from read timeouts
+if hasattr(aiohttp, "ConnectionTimeoutError"):
+    connect_errors += (aiohttp.ConnectionTimeoutError,)
+
+
+class UploadNotSent(Exception):
+    # The post never reached the server, so trying again can't post it twice
+    pass
+
+
+async def upload_stream(bot, chunks, name, room_id):
+    # Streamed bodies can't be replayed so there are no retries here
+    # Raises UploadNotSent when nothing was posted, False means it may have been
+    link = f"{bot.url}/message/send/{room_id}"
+    ctype = media_type(name)
+    data = aiohttp.FormData()
+    data.add_field(name="files[]", value=chunks, filename=name, content_type=ctype)
+    token = bot.token
+    started = time.monotonic()
+
+    try:
+        async with bot.http_session(link).post(link, data=data) as response:
+            await response.text()
+    except connect_errors as e:
+        raise UploadNotSent(str(e)) from e
+    except Exception as e:
+        msg(f"(Upload) Error: {e}")
+        return False
+
+    bot.metrics.count("gluebot_uploads_total", (("status", response.status),))
+
+    # A rejected session didn't post anything
+    if response.status in [401, 403]:
+        msg(f"(Upload) Status {response.status}, logging in again")
+        await bot.reauth(token)
+        raise UploadNotSent(f"status {response.status}")
+
+    if response.status >= 400:
+        msg(f"(Upload) Error: status {response.status}")
+        return False
+
+    msg(f"(Upload) {name}: streamed in {time.monotonic() - started:.2f}s")
+    return True
+
+
+async def upload(bot, path, room_id):
+    if (not path.exists()) or (not path.is_file()):
+        return
+
+    link = f"{bot.url}/message/send/{room_id}"
+    size = path.stat().st_size
+    ctype = media_type(path)
+
+    attempt = 0
+    reauthed = False
+
+    while True:
+        data = aiohttp.FormData()
+        value = FilePayload(path, size, filename=path.name, content_type=ctype)
+        data.add_field(
+            name="files[]", value=value, filename=path.name, content_type=ctype
+        )
+
+        token = bot.token
+        started = time.monotonic()
+
+        try:
+            with bot.metrics.stage("upload"):
+                async with bot.http_session(link).post(link, data=data) as response:
+                    await response.text()
+
+            bot.metrics.count("gluebot_uploads_total", (("status", response.status),))
+
+            # A rejected session logs in again and the post is tried once more
+            if (response.status in [401, 403]) and (not reauthed):
+                msg(f"(Upload) Status {response.status}, logging in again")
+                reauthed = True
+                await bot.reauth(token)
+                continue
+
+            if response.status in retry_statuses:
+                error = f"status {response.status}"
+            elif response.status >= 400:
+                msg(f"(Upload) Error: status {response.status} for {path.name}")
+                return
+            else:
+                elapsed = time.monotonic() - started
+                rate = size / 1024 / max(elapsed, 0.001)
+                stats = f"{size / 1024:.0f} KB in {elapsed:.2f}s ({rate:.0f} KB/s)"
+                msg(f"(Upload) {path.name}: {stats}")
+                return
+        except connect_errors as e:
+            error = e
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            msg(f"(Upload) Error: {e}, not retrying {path.name}")
+            return
+        except Exception as e:
+            msg(f"(Upload) Error: {e}")
+            traceback.print_exc()
+            return
+
+        if attempt >= config.upload_retries:
+            msg(f"(Upload) Error: {error}, giving up on {path.name}")
+            return
+
+        wait = config.upload_backoff * (2**attempt)
+        attempt += 1
+        msg(f"(Upload) Error: {error}, retrying in {wait}s")
+        await asyncio.sleep(wait)
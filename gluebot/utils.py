@@ -0,0 +1,97 @@
+import hashlib
+import html
+import random
+import re
+import sys
+import traceback
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from . import config
+
+
+def msg(message: str) -> None:
+    print(message, file=sys.stderr)
+
+
+def get_time():
+    return datetime.now().timestamp()
+
+
+def remove_file(path):
+    try:
+        path.unlink()
+    except Exception as e:
+        msg(f"(Remove) Error: {e}")
+        traceback.print_exc()
+
+
+def get_extension(path):
+    return Path(path).suffix.lower().lstrip(".")
+
+
+def clean_lines(s):
+    cleaned = s
+    cleaned = re.sub(r" *(\n+|\\n+) *", "\n", cleaned)
+    cleaned = re.sub(r" +", " ", cleaned)
+    return cleaned.strip()
+
+
+def random_int(min_val, max_val):
+    return random.randint(min_val, max_val)
+
+
+def random_date():
+    two_years = 730
+    twelve_years = 4380
+    start_date = datetime.now() - timedelta(days=two_years)
+    end_date = start_date + timedelta(days=(twelve_years))
+    random_days = random.randint(0, (end_date - start_date).days)
+    random_date = start_date + timedelta(days=random_days)
+    return random_date.strftime("%d %b %Y")
+
+
+def get_path(name):
+    return str(Path(config.HERE, name))
+
+
+def extract_range(string):
+    pattern = r"(?:(?P<number1>-?\d+)(?:\s*(.+?)\s*(?P<number2>-?\d+))?)?"
+    match = re.search(pattern, string)
+    num1 = None
+    num2 = None
+
+    if match["number1"]:
+        num1 = int(match["number1"])
+
+    if match["number2"]:
+        num2 = int(match["number2"])
+
+    return [num1, num2]
+
+
+def clean_list(lst):
+    return list(filter(lambda x: x != "", lst))
+
+
+def string_to_number(input_string, seed=None):
+    # blake2b instead of hash() which is salted differently in every process
+    if seed is None:
+        seed = config.numbers_seed
+
+    key = seed.encode()[:64]
+    digest = hashlib.blake2b(input_string.encode(), digest_size=8, key=key).digest()
+    scaled_number = int.from_bytes(digest, "big") % 1000
+    return scaled_number
+
+
+def clean_string(string):
+    return html.unescape(string)
+
+
+def escape_quotes(string):
+    return string.replace('"', '\\"')
+
+
+def remove_char(string, char):
+    return string.replace(char, "")
@@ -0,0 +1,341 @@
+# Warm render worker for gifmaker
+# Run it with the same python that gifmaker is installed into
+# It imports gifmaker once, then forks a child for every job
+# so each render starts with warm imports and fresh module state
+#
+# Protocol, one JSON object per line:
+# stdin:  {"id": 1, "argv": ["gifmaker", "--input", ...]}
+# stdout: {"id": 1, "code": 0, "stdout": "/tmp/gifmaker/job-x/render.gif", "stderr": ""}
+
+import argparse
+import hashlib
+import importlib.metadata
+import io
+import json
+import mmap
+import os
+import runpy
+import signal
+import sys
+import tempfile
+import traceback
+from pathlib import Path
+
+# Response lines are kept below PIPE_BUF (4096 on Linux) in bytes
+# so writes from parallel children never interleave
+max_line = 4000
+# Characters of stdout and stderr sent back before any further trimming
+max_output = 1500
+# Still templates as (mode, size, format, mapped raw pixels)
+stills = {}
+# Animated templates point to a resized copy
+animations = {}
+
+
+def msg(message: str) -> None:
+    print(message, file=sys.stderr)
+
+
+def find_entry(name):
+    for entry in importlib.metadata.entry_points(group="console_scripts", name=name):
+        return entry.load()
+
+    return None
+
+
+def target_size(size, width):
+    # Same as gifmaker's --nogrow, images are only ever made smaller
+    if (not width) or (size[0] <= width):
+        return size
+
+    return (width, max(1, round(size[1] * width / size[0])))
+
+
+def prepare_still(Image, image, size, base):
+    raw = base.with_suffix(".raw")
+    meta = base.with_suffix(".json")
+
+    if not (raw.exists() and meta.exists()):
+        mode = image.mode
+
+        if mode not in ["RGB", "RGBA", "L"]:
+            mode = "RGBA" if "transparency" in image.info else "RGB"
+            image = image.convert(mode)
+
+        if image.size != size:
+            image = image.resize(size, Image.LANCZOS)
+
+        # Meta goes last and readers check for it, so raw is complete by then
+        temp = raw.with_name(f"{raw.name}.{os.getpid()}.tmp")
+        temp.write_bytes(image.tobytes())
+        temp.replace(raw)
+        temp = meta.with_name(f"{meta.name}.{os.getpid()}.tmp")
+        temp.write_text(json.dumps({"mode": mode, "size": list(size)}))
+        temp.replace(meta)
+
+    info = json.loads(meta.read_text())
+
+    with open(raw, "rb") as file:
+        pixels = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    return info["mode"], tuple(info["size"]), pixels
+
+
+def prepare_animation(Image, ImageSequence, image, size, base):
+    path = base.with_suffix(".gif")
+
+    if path.exists():
+        return path
+
+    frames = []
+    durations = []
+
+    for frame in ImageSequence.Iterator(image):
+        durations.append(frame.info.get("duration", 100))
+        frames.append(frame.convert("RGBA").resize(size, Image.LANCZOS))
+
+    # Unique per process since several bots' workers can share the directory
+    temp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+
+    frames[0].save(
+        temp,
+        format="GIF",
+        save_all=True,
+        append_images=frames[1:],
+        duration=durations,
+        loop=image.info.get("loop", 0),
+        disposal=2,
+    )
+
+    temp.replace(path)
+    return path
+
+
+def preload(paths, width, cache):
+    # Templates are decoded and resized once, stills are kept as raw pixels
+    # in mapped files that every forked child shares
+    if not paths:
+        return
+
+    try:
+        from PIL import Image, ImageSequence
+    except ImportError:
+        msg("(Worker) PIL is not available, not preloading templates")
+        return
+
+    cache.mkdir(parents=True, exist_ok=True)
+    keep = set()
+
+    for path in paths:
+        try:
+            path = Path(path).resolve()
+            digest = hashlib.sha1(path.read_bytes())
+            digest.update(str(width).encode())
+            base = Path(cache, f"{path.stem}-{digest.hexdigest()[:16]}")
+            keep.add(base.name)
+            image = Image.open(path)
+            size = target_size(image.size, width)
+
+            if getattr(image, "n_frames", 1) > 1:
+                animations[str(path)] = prepare_animation(
+                    Image, ImageSequence, image, size, base
+                )
+            else:
+                image.load()
+                mode, size, pixels = prepare_still(Image, image, size, base)
+                stills[str(path)] = (mode, size, image.format, pixels)
+        except Exception as e:
+            msg(f"(Worker) Can't preload {path}: {e}")
+
+    # Files from older versions of the templates
+    for path in cache.iterdir():
+        if path.name.split(".")[0] not in keep:
+            path.unlink(missing_ok=True)
+
+    if (not stills) and (not animations):
+        return
+
+    original_open = Image.open
+
+    def cached_open(fp, *args, **kwargs):
+        if isinstance(fp, (str, Path)):
+            key = str(Path(fp).resolve())
+            still = stills.get(key)
+
+            if still:
+                mode, size, format, pixels = still
+                image = Image.frombuffer(mode, size, pixels, "raw", mode, 0, 1)
+                image = image.copy()
+                image.format = format
+                return image
+
+            animation = animations.get(key)
+
+            if animation:
+                fp = animation
+
+        return original_open(fp, *args, **kwargs)
+
+    Image.open = cached_open
+
+
+def run_job(entry, script, argv):
+    sys.argv = argv
+
+    if entry:
+        result = entry()
+    else:
+        runpy.run_path(script, run_name="__main__")
+        result = 0
+
+    return result
+
+
+def exit_code(result):
+    if result is None:
+        return 0
+
+    if isinstance(result, int):
+        return result
+
+    return 1
+
+
+def respond(protocol_fd, entry, script, request):
+    # Output from gifmaker and anything it spawns goes to temp files
+    out_file = tempfile.TemporaryFile()
+    err_file = tempfile.TemporaryFile()
+    os.dup2(out_file.fileno(), 1)
+    os.dup2(err_file.fileno(), 2)
+    sys.stdout = io.TextIOWrapper(os.fdopen(1, "wb", closefd=False), write_through=True)
+    sys.stderr = io.TextIOWrapper(os.fdopen(2, "wb", closefd=False), write_through=True)
+
+    try:
+        code = exit_code(run_job(entry, script, request["argv"]))
+    except SystemExit as e:
+        code = exit_code(e.code)
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    out_file.seek(0)
+    err_file.seek(0)
+    stdout = out_file.read().decode(errors="replace")
+    stderr = err_file.read().decode(errors="replace")
+
+    os.write(protocol_fd, encode_response(request["id"], code, stdout, stderr))
+
+
+def encode_response(id, code, stdout, stderr):
+    # Escaped characters take up to 12 bytes each, so the encoded line is
+    # what gets measured, stderr loses its start first, then stdout
+    stdout = stdout.strip()[-max_output:]
+    stderr = stderr[-max_output:]
+
+    while True:
+        response = {"id": id, "code": code, "stdout": stdout, "stderr": stderr}
+        line = (json.dumps(response) + "\n").encode()
+
+        if (len(line) <= max_line) or ((not stdout) and (not stderr)):
+            return line
+
+        if stderr:
+            stderr = stderr[len(stderr) // 2 + 1 :]
+        else:
+            stdout = stdout[len(stdout) // 2 + 1 :]
+
+
+def reap(children):
+    # Finished children are collected here so a pid in children is never reused
+    while True:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+
+        if pid == 0:
+            return
+
+        for id, child in list(children.items()):
+            if child == pid:
+                del children[id]
+
+
+def serve(entry, script):
+    # The protocol gets its own copy of stdout, fd 1 itself goes to devnull
+    protocol_fd = os.dup(1)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    # Request id to pid, each job leads its own process group
+    # SIGCHLD stays at its default so the tools gifmaker runs get real exit codes
+    children = {}
+
+    for line in sys.stdin:
+        reap(children)
+
+        try:
+            request = json.loads(line)
+        except Exception as e:
+            msg(f"(Worker) Bad request: {e}")
+            continue
+
+        # {"kill": id} stops a job that timed out or was cancelled
+        if "kill" in request:
+            pid = children.pop(request["kill"], None)
+
+            if pid:
+                try:
+                    os.killpg(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+
+            continue
+
+        pid = os.fork()
+
+        if pid == 0:
+            os.setpgid(0, 0)
+
+            try:
+                respond(protocol_fd, entry, script, request)
+            finally:
+                os._exit(0)
+
+        # Set on both sides so a kill right after the fork finds the group
+        try:
+            os.setpgid(pid, pid)
+        except OSError:
+            pass
+
+        children[request["id"]] = pid
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entry", type=str, default="gifmaker")
+    parser.add_argument("--script", type=str, default=None)
+    parser.add_argument("--preload", type=str, nargs="*", default=[])
+    parser.add_argument("--width", type=int, default=0)
+    parser.add_argument("--cache", type=str, default="/tmp/gifmaker-templates")
+    args = parser.parse_args()
+
+    entry = None
+
+    try:
+        entry = find_entry(args.entry)
+    except Exception as e:
+        msg(f"(Worker) Can't load entry point {args.entry}: {e}")
+
+    if (not entry) and (not args.script):
+        msg("(Worker) No gifmaker entry point or script found")
+        sys.exit(1)
+
+    preload(args.preload, args.width, Path(args.cache))
+    msg("(Worker) Ready")
+    serve(entry, args.script)
+
+
+if __name__ == "__main__":
+    main()